@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iland.settings')
+# Verify login passwords off the event loop (see ASYNC_LOGIN in settings)
+os.environ.setdefault('ASYNC_LOGIN', 'True')
 
 application = get_asgi_application()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
@@ -79,6 +80,106 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Caches
+# 'default' is per-process; 'shared' is visible to every worker and carries the
+# version stamps used to invalidate per-process caches (point it at Redis or
+# Memcached when workers run on more than one host)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': os.getenv('SHARED_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+    },
+}
+
+# CMS settings are cached per process for at most CMS_SETTINGS_CACHE_TTL
+# seconds; workers notice a save within CMS_SETTINGS_VERSION_CHECK_INTERVAL
+CMS_SETTINGS_CACHE_TTL = int(os.getenv('CMS_SETTINGS_CACHE_TTL', '60'))
+CMS_SETTINGS_VERSION_CHECK_INTERVAL = float(os.getenv('CMS_SETTINGS_VERSION_CHECK_INTERVAL', '2'))
+
+# The aggregated public homepage payload is rebuilt after PUBLIC_HOME_CACHE_TTL
+# seconds, or as soon as a worker notices that homepage content changed
+PUBLIC_HOME_CACHE_TTL = int(os.getenv('PUBLIC_HOME_CACHE_TTL', '300'))
+PUBLIC_HOME_VERSION_CHECK_INTERVAL = float(os.getenv('PUBLIC_HOME_VERSION_CHECK_INTERVAL', '2'))
+
+# Page size for the cursor-paginated admin leads list (?page_size= overrides
+# it up to LEADS_MAX_PAGE_SIZE)
+LEADS_PAGE_SIZE = int(os.getenv('LEADS_PAGE_SIZE', '50'))
+LEADS_MAX_PAGE_SIZE = int(os.getenv('LEADS_MAX_PAGE_SIZE', '500'))
+
+# Lead search uses the SQLite FTS5 index in users/search.py; set to False to
+# fall back to icontains filters
+LEAD_SEARCH_FTS = os.getenv('LEAD_SEARCH_FTS', 'True') == 'True'
+# Maximum number of relevance-ranked results returned by the admin leads search
+# (the response sets truncated when more leads matched)
+LEAD_SEARCH_LIMIT = int(os.getenv('LEAD_SEARCH_LIMIT', '200'))
+
+# Rows validated and inserted per transaction by the bulk lead endpoint
+BULK_LEAD_CHUNK_SIZE = int(os.getenv('BULK_LEAD_CHUNK_SIZE', '1000'))
+
+# Set LEAD_WRITE_BEHIND to queue public lead submissions in a separate SQLite
+# journal and answer 202 at once; `manage.py drain_lead_queue --loop` creates
+# the leads (see users/lead_queue.py)
+LEAD_WRITE_BEHIND = os.getenv('LEAD_WRITE_BEHIND', 'False') == 'True'
+LEAD_QUEUE_PATH = os.getenv('LEAD_QUEUE_PATH', os.path.join(BASE_DIR, 'lead_queue.sqlite3'))
+
+# A public or bulk lead submission matching the email, phone and source page
+# of a lead created in the last LEAD_DEDUP_WINDOW seconds is reported as a
+# duplicate instead of creating a new lead (0 disables); with
+# LEAD_WRITE_BEHIND the drain does this. Each process remembers up to
+# LEAD_DEDUP_CACHE_SIZE recent fingerprints
+LEAD_DEDUP_WINDOW = int(os.getenv('LEAD_DEDUP_WINDOW', '600'))
+LEAD_DEDUP_CACHE_SIZE = int(os.getenv('LEAD_DEDUP_CACHE_SIZE', '10000'))
+
+# New public and bulk leads are assigned to an active agent on creation (see
+# users/assignment.py): 'least_loaded' picks the agent with the fewest open
+# leads, 'round_robin' takes agents in turn, 'none' leaves leads unassigned.
+# LEAD_ASSIGNMENT_SOURCE_RULES routes a traffic source to its own agents, as
+# JSON mapping the source to agent emails, e.g. {"google": ["a@example.com"]}.
+# Each process keeps the open-lead counts in memory and reloads them from the
+# rollup every LEAD_ASSIGNMENT_RESYNC_INTERVAL seconds, and notices a changed
+# agent within LEAD_ASSIGNMENT_VERSION_CHECK_INTERVAL. Workers don't see each
+# other's assignments in between, so with several workers a burst can favour
+# one agent until the next resync
+LEAD_ASSIGNMENT_STRATEGY = os.getenv('LEAD_ASSIGNMENT_STRATEGY', 'least_loaded')
+LEAD_ASSIGNMENT_SOURCE_RULES = json.loads(os.getenv('LEAD_ASSIGNMENT_SOURCE_RULES', '{}'))
+LEAD_ASSIGNMENT_RESYNC_INTERVAL = int(os.getenv('LEAD_ASSIGNMENT_RESYNC_INTERVAL', '60'))
+LEAD_ASSIGNMENT_VERSION_CHECK_INTERVAL = float(os.getenv('LEAD_ASSIGNMENT_VERSION_CHECK_INTERVAL', '2'))
+
+# Largest number of lead updates an agent may send to /api/agent/leads/batch/
+AGENT_LEAD_BATCH_MAX_SIZE = int(os.getenv('AGENT_LEAD_BATCH_MAX_SIZE', '100'))
+
+# Lead responses include the newest LEAD_NOTES_LIMIT notes of each lead;
+# ?notes=<n> asks for another number and ?notes=all for every note
+LEAD_NOTES_LIMIT = int(os.getenv('LEAD_NOTES_LIMIT', '20'))
+
+# Rows read from the database per chunk by the lead and deal exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Uploaded images get WebP and JPEG variants at these widths (see
+# users/images.py), rendered by a pool of IMAGE_VARIANT_WORKERS processes;
+# 0 renders them in the thread that saved the image
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,960,1280,1920').split(',')]
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+
+# Country calling code assumed for lead phone numbers written in national
+# format (e.g. 050... -> +97150...)
+LEAD_DEFAULT_COUNTRY_CODE = os.getenv('LEAD_DEFAULT_COUNTRY_CODE', '971')
+
+# iland/asgi.py serves /api/login/ and /api/token/ with async views that
+# verify passwords on a pool of LOGIN_HASH_WORKERS threads (users/hashing.py)
+# instead of the event loop. Up to LOGIN_HASH_MAX_QUEUE more checks wait for
+# a free thread; further logins get a 503 until the queue drains
+ASYNC_LOGIN = os.getenv('ASYNC_LOGIN', 'False') == 'True'
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+LOGIN_HASH_MAX_QUEUE = int(os.getenv('LOGIN_HASH_MAX_QUEUE', '64'))
+
+# Seconds the role and account flags of a JWT-authenticated user stay in the
+# shared cache (saving the user drops the entry immediately)
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', '300'))
+
 # Media files settings (for handling uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -86,7 +187,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
 }
 
@@ -105,8 +206,18 @@ SIMPLE_JWT = {
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    # Rotated refresh tokens are revoked through users/revocation.py
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Revoked refresh token JTIs are checked against a per-process Bloom filter
+# sized for REVOKED_TOKEN_BLOOM_CAPACITY entries (it grows past that), rebuilt
+# from the table every REVOKED_TOKEN_REBUILD_INTERVAL seconds. Expired
+# revocations are deleted at most once every REVOKED_TOKEN_PURGE_INTERVAL
+REVOKED_TOKEN_BLOOM_CAPACITY = int(os.getenv('REVOKED_TOKEN_BLOOM_CAPACITY', '100000'))
+REVOKED_TOKEN_REBUILD_INTERVAL = int(os.getenv('REVOKED_TOKEN_REBUILD_INTERVAL', '3600'))
+REVOKED_TOKEN_PURGE_INTERVAL = int(os.getenv('REVOKED_TOKEN_PURGE_INTERVAL', '3600'))
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 # CORS settings for media files
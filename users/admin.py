@@ -180,14 +180,15 @@ class UserAdmin(admin.ModelAdmin):
 class LeadAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'phone', 'status', 'assigned_agent', 'created_at', 'updated_at')
     list_filter = ('status', 'assigned_agent', 'created_at')
-    search_fields = ('name', 'email', 'phone', 'message')
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('name', 'email', 'phone')
+    # The legacy notes blob; notes are LeadNote rows now and nothing reads it
+    readonly_fields = ('internal_notes', 'created_at', 'updated_at')
     fieldsets = (
         ('Contact Information', {
             'fields': ('name', 'email', 'phone')
         }),
         ('Lead Details', {
-            'fields': ('message', 'property_interest', 'budget', 'preferred_contact')
+            'fields': ('source_page', 'traffic_source', 'utm_source', 'utm_medium', 'utm_campaign')
         }),
         ('Assignment', {
             'fields': ('assigned_agent', 'status')
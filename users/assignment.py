@@ -0,0 +1,231 @@
+"""
+Automatic lead assignment.
+
+New public and bulk leads are given to an agent for whom
+CustomUser.is_active_agent holds, chosen by LEAD_ASSIGNMENT_STRATEGY:
+
+- least_loaded: the agent with the fewest open leads (Lead.OPEN_STATUSES);
+  ties go to the agent who has waited longest for a lead
+- round_robin: agents in turn
+- none: leads stay unassigned for an admin to assign
+
+LEAD_ASSIGNMENT_SOURCE_RULES narrows the candidates for a traffic source to
+the listed agents; other sources, and sources whose agents are all inactive,
+use every active agent.
+
+Each process keeps the open-lead count of every agent in memory, with a
+min-heap per candidate pool, so picking an agent costs O(log n) and no
+queries. The counts are loaded with one grouped query over LeadDailyStat,
+kept current by the Lead signal receivers and create_leads(), and reloaded
+every LEAD_ASSIGNMENT_RESYNC_INTERVAL seconds or as soon as an agent is
+saved. The receivers apply a change once its transaction commits, so a
+rolled back save leaves the counts alone.
+
+The counts are per process: a worker doesn't see the leads other workers
+assign until its next resync. Workers loaded from the same rollup make the
+same picks, so a burst spread over W workers can give the least loaded
+agent up to W leads before any of them moves on. Each resync evens the
+split out again, so LEAD_ASSIGNMENT_RESYNC_INTERVAL bounds how far it can
+drift; lower it, or run fewer workers, where leads must be balanced
+closely.
+"""
+import heapq
+import itertools
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .cache import VersionedLocalCache, bump_version
+from .models import CustomUser, Lead, LeadDailyStat
+
+ALL_AGENTS = None  # pool key of the pool holding every active agent
+
+# CustomUser fields that decide whether, and for which sources, a user is a
+# candidate; saves that touch none of them (e.g. last_login) keep the state
+AGENT_FIELDS = {'role', 'status', 'profile_visible', 'email'}
+
+
+class AssignmentState:
+    """Open-lead counts and candidate pools loaded by load_state()"""
+
+    def __init__(self, open_counts, source_pools):
+        self.counts = dict(open_counts)
+        self.pools = {ALL_AGENTS: sorted(self.counts)}
+        for source, agent_ids in source_pools.items():
+            agent_ids = sorted(agent_id for agent_id in set(agent_ids) if agent_id in self.counts)
+            if agent_ids:
+                self.pools[source] = agent_ids
+
+        self.memberships = {agent_id: [] for agent_id in self.counts}
+        for key, agent_ids in self.pools.items():
+            for agent_id in agent_ids:
+                self.memberships[agent_id].append(key)
+
+        # Heap entries are (open count, sequence, agent id). An entry whose
+        # count no longer matches self.counts is stale and is dropped when it
+        # reaches the top; the sequence breaks ties in favour of the agent
+        # whose count changed longest ago.
+        self._sequence = itertools.count()
+        self.heaps = {}
+        for key in self.pools:
+            self._rebuild_heap(key)
+        self.cursors = dict.fromkeys(self.pools, 0)
+
+    def _rebuild_heap(self, key):
+        heap = [(self.counts[agent_id], next(self._sequence), agent_id) for agent_id in self.pools[key]]
+        heapq.heapify(heap)
+        self.heaps[key] = heap
+
+    def pool_for(self, traffic_source):
+        return traffic_source if traffic_source in self.pools else ALL_AGENTS
+
+    def least_loaded(self, key):
+        heap = self.heaps[key]
+        while heap:
+            count, _, agent_id = heap[0]
+            if self.counts[agent_id] == count:
+                return agent_id
+            heapq.heappop(heap)
+        return None
+
+    def round_robin(self, key):
+        agent_ids = self.pools[key]
+        if not agent_ids:
+            return None
+        agent_id = agent_ids[self.cursors[key] % len(agent_ids)]
+        self.cursors[key] += 1
+        return agent_id
+
+    def adjust(self, agent_id, delta):
+        """Add delta to an agent's open-lead count (ignored for non-candidates)"""
+        if agent_id not in self.counts:
+            return
+        self.counts[agent_id] += delta
+        entry = (self.counts[agent_id], next(self._sequence), agent_id)
+        for key in self.memberships[agent_id]:
+            heap = self.heaps[key]
+            heapq.heappush(heap, entry)
+            if len(heap) > 4 * len(self.pools[key]) + 64:
+                # Too many stale entries; start over from the counts
+                self._rebuild_heap(key)
+
+
+def load_state():
+    """Load the active agents and their open-lead counts: two queries"""
+    # Same conditions as CustomUser.is_active_agent
+    agents = dict(
+        CustomUser.objects
+        .filter(role='agent', status='active', profile_visible=True)
+        .values_list('id', 'email')
+    )
+    open_counts = dict.fromkeys(agents, 0)
+    rows = (
+        LeadDailyStat.objects
+        .filter(assigned_agent__isnull=False, status__in=Lead.OPEN_STATUSES)
+        .values('assigned_agent')
+        .annotate(open_leads=Sum('count'))
+    )
+    for row in rows:
+        if row['assigned_agent'] in open_counts:
+            open_counts[row['assigned_agent']] = row['open_leads']
+
+    ids_by_email = {email.lower(): agent_id for agent_id, email in agents.items() if email}
+    source_pools = {
+        source: [ids_by_email[email.lower()] for email in emails if email.lower() in ids_by_email]
+        for source, emails in settings.LEAD_ASSIGNMENT_SOURCE_RULES.items()
+    }
+    return AssignmentState(open_counts, source_pools)
+
+
+def counts_as_open(key):
+    """Whether a Lead.stats_key() adds to an agent's open-lead count"""
+    return key is not None and key[1] is not None and key[2] in Lead.OPEN_STATUSES
+
+
+class AssignmentEngine:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = VersionedLocalCache(
+            'lead_assignment',
+            load_state,
+            ttl=settings.LEAD_ASSIGNMENT_RESYNC_INTERVAL,
+            check_interval=settings.LEAD_ASSIGNMENT_VERSION_CHECK_INTERVAL,
+        )
+
+    def _pick(self, state, traffic_source):
+        key = state.pool_for(traffic_source)
+        if settings.LEAD_ASSIGNMENT_STRATEGY == 'round_robin':
+            return state.round_robin(key)
+        return state.least_loaded(key)
+
+    def pick(self, traffic_source=None):
+        """
+        Return the id of the agent a new lead from traffic_source should go
+        to, or None. The count is not changed here: saving the lead does that
+        through lead_changed().
+        """
+        if settings.LEAD_ASSIGNMENT_STRATEGY == 'none':
+            return None
+        state = self._state.get()
+        with self._lock:
+            return self._pick(state, traffic_source)
+
+    def assign_new_leads(self, leads):
+        """
+        Assign unsaved, unassigned leads for create_leads(), which bypasses
+        the signal receivers. Each pick counts towards the next ones so that
+        one batch is spread across agents, but the counts are left as they
+        were: returns {agent id: open leads added} for leads_added() to
+        apply once the leads are committed.
+        """
+        added = Counter()
+        if settings.LEAD_ASSIGNMENT_STRATEGY == 'none':
+            return added
+        state = self._state.get()
+        with self._lock:
+            for lead in leads:
+                if lead.assigned_agent_id is not None:
+                    continue
+                lead.assigned_agent_id = self._pick(state, lead.traffic_source)
+                if lead.assigned_agent_id is not None and lead.status in Lead.OPEN_STATUSES:
+                    state.adjust(lead.assigned_agent_id, 1)
+                    added[lead.assigned_agent_id] += 1
+            for agent_id, count in added.items():
+                state.adjust(agent_id, -count)
+        return added
+
+    def leads_added(self, added):
+        """Add the committed leads counted by assign_new_leads() to the open-lead counts"""
+        state = self._state.peek()
+        if state is None:
+            return
+        with self._lock:
+            for agent_id, count in added.items():
+                state.adjust(agent_id, count)
+
+    def lead_changed(self, old_key, new_key):
+        """
+        Move a lead between agents' open-lead counts, given its stats_key()
+        before and after a committed save (None when created or deleted).
+        Does nothing until the state is loaded, since loading reads the
+        rollup, which already includes the change.
+        """
+        state = self._state.peek()
+        if state is None:
+            return
+        with self._lock:
+            if counts_as_open(old_key):
+                state.adjust(old_key[1], -1)
+            if counts_as_open(new_key):
+                state.adjust(new_key[1], 1)
+
+    def invalidate(self):
+        """Reload the agents and counts in this process and in every other worker"""
+        bump_version('lead_assignment')
+        self._state.invalidate()
+
+
+engine = AssignmentEngine()
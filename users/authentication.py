@@ -1,31 +1,164 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.functions import Lower
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import hashing
+from .cache import get_shared_cache
 
 User = get_user_model()
 
 class EmailBackend(ModelBackend):
     """
     Custom authentication backend that allows users to login with their email address.
+
+    It looks accounts up by email or username itself, so failed logins raise
+    PermissionDenied once the password has been hashed: that ends the
+    backend chain, and ModelBackend doesn't hash the password a second time
+    (on the event loop, under aauthenticate()).
     """
-    
+
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Try to get user by email or username
-            user = User.objects.get(
-                Q(email=username) | Q(username=username)
-            )
-            
-            # Check if the password is correct
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = self.get_user_by_login(username)
+        if user is None:
+            # Run the default password hasher once so that a missing account
+            # takes as long as a wrong password and timing doesn't leak it
+            User().set_password(password)
+            raise PermissionDenied
+
+        # Check if the password is correct
+        if user.check_password(password):
+            return user
+
+        raise PermissionDenied
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Same as authenticate(), but the password hash runs on the bounded
+        pool in users/hashing.py instead of blocking the event loop. Raises
+        hashing.HashQueueFull when too many checks are already waiting.
+        """
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
             return None
-        
-        return None
-    
+
+        user = await sync_to_async(self.get_user_by_login)(username)
+        if user is None:
+            await hashing.make_password(password)
+            raise PermissionDenied
+
+        is_correct, must_update = await hashing.check_password(password, user.password)
+        if not is_correct:
+            raise PermissionDenied
+        if must_update:
+            user.password = await hashing.make_password(password)
+            await user.asave(update_fields=['password'])
+        return user
+
+    def get_user_by_login(self, login):
+        """
+        Find the user for a login identifier: a case-insensitive match on the
+        indexed LOWER(email) for email addresses, otherwise the username
+        """
+        login = login.strip()
+        try:
+            validate_email(login)
+        except ValidationError:
+            return User.objects.filter(username=login).first()
+
+        return (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower=login.lower())
+            .order_by('pk')
+            .first()
+        )
+
     def get_user(self, user_id):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+# Fields read by the permission classes; CachedJWTAuthentication keeps them in
+# the shared cache so that those checks don't need the users table
+CACHED_USER_FIELDS = ('id', 'role', 'status', 'is_active', 'is_staff')
+
+
+def cached_user_key(user_id):
+    return f'jwt-user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """Drop a user's cached fields in every worker (see signals.py)"""
+    get_shared_cache().delete(cached_user_key(user_id))
+
+
+def get_cached_user(user_id):
+    """
+    Return the user with only CACHED_USER_FIELDS loaded (the rest deferred),
+    from the shared cache when possible, or None if there is no such user
+    """
+    cache = get_shared_cache()
+    values = cache.get(cached_user_key(user_id))
+    if values is None:
+        values = (
+            User.objects
+            .filter(**{jwt_settings.USER_ID_FIELD: user_id})
+            .values(*CACHED_USER_FIELDS)
+            .first()
+        )
+        if values is None:
+            return None
+        cache.set(cached_user_key(user_id), values, settings.JWT_USER_CACHE_TTL)
+
+    # from_db() takes the values in model field order
+    field_names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in values
+    ]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from the shared cache.
+
+    The returned user only has CACHED_USER_FIELDS loaded; any other field is
+    deferred and loaded from the database on first access, so views that need
+    the full profile still see it. Entries expire after JWT_USER_CACHE_TTL
+    seconds and are dropped whenever the user is saved or deleted.
+    """
+
+    def get_user(self, validated_token):
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            # The revoke check compares against the password hash
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
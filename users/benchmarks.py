@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CustomUser, Deal, Lead
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """Run the block against a freshly migrated throwaway test database"""
+    old_name = connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def median_ms(func, repeat=5):
+    """Call func repeat times and return the median wall time in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def seed_agents(count):
+    """Create count agent users and return their ids"""
+    agents = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench-agent-{i}', email=f'bench-agent-{i}@example.com', role='agent')
+        for i in range(count)
+    ])
+    return [agent.id for agent in agents]
+
+
+def seed_leads(count, agent_ids, days=730, batch_size=10000, deal_ratio=0.05):
+    """
+    Insert count leads (and deals for a share of the converted ones) with raw
+    executemany batches; model save() and signals are deliberately bypassed
+    """
+    statuses = [choice for choice, _ in Lead.STATUS_CHOICES]
+    sources = ['organic', 'google', 'facebook', 'instagram', 'tiktok', None]
+    campaigns = [f'campaign-{i}' for i in range(40)] + [None] * 10
+    rng = random.Random(42)
+    end = timezone.now()
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    adapt_date = connection.ops.adapt_datefield_value
+
+    lead_table = Lead._meta.db_table
+    lead_columns = [
+        'name', 'email', 'phone', 'source_page', 'traffic_source', 'utm_campaign',
+        'status', 'assigned_agent_id', 'internal_notes', 'created_at', 'updated_at',
+    ]
+    lead_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        lead_table, ', '.join(lead_columns), ', '.join(['%s'] * len(lead_columns))
+    )
+    deal_table = Deal._meta.db_table
+    deal_sql = (
+        'INSERT INTO %s (lead_id, revenue_amount, currency, closed_date, commission_rate, '
+        'commission_amount, created_at, updated_at) VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)'
+        % deal_table
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, count, batch_size):
+            rows = []
+            for i in range(offset, min(offset + batch_size, count)):
+                created_at = end - timedelta(seconds=rng.randrange(days * 86400))
+                rows.append((
+                    f'Lead {i}',
+                    f'lead{i}@example.com',
+                    f'+97150{i:07d}',
+                    f'/properties/listing-{i % 500}',
+                    rng.choice(sources),
+                    rng.choice(campaigns),
+                    rng.choice(statuses),
+                    rng.choice(agent_ids) if rng.random() < 0.9 else None,
+                    '{}',
+                    adapt_datetime(created_at),
+                    adapt_datetime(created_at + timedelta(hours=rng.randrange(240))),
+                ))
+            cursor.executemany(lead_sql, rows)
+
+        # Converted leads are one status in len(statuses); give deals to enough
+        # of them that deal_ratio of all leads end up with one
+        cursor.execute('SELECT id FROM %s WHERE status = %%s' % lead_table, ['converted'])
+        now = adapt_datetime(end)
+        deals = []
+        for (lead_id,) in cursor.fetchall():
+            if rng.random() >= deal_ratio * len(statuses):
+                continue
+            revenue = rng.randrange(100000, 5000000)
+            closed_date = adapt_date((end - timedelta(days=rng.randrange(days))).date())
+            deals.append((lead_id, revenue, 'AED', closed_date, 5, revenue * 5 / 100, now, now))
+        cursor.executemany(deal_sql, deals)
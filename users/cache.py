@@ -0,0 +1,72 @@
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+
+
+def get_shared_cache():
+    """Cache shared by every worker process (see CACHES['shared'])"""
+    return caches['shared']
+
+
+def get_version(name):
+    """Return the current cross-worker version stamp for name"""
+    return get_shared_cache().get(f'version:{name}')
+
+
+def bump_version(name):
+    """Give name a fresh version stamp, invalidating every worker's copy"""
+    stamp = uuid.uuid4().hex
+    get_shared_cache().set(f'version:{name}', stamp, None)
+    return stamp
+
+
+class VersionedLocalCache:
+    """
+    Process-local cache for a single value. The value is reloaded after ttl
+    seconds, or sooner when the shared version stamp for name changes; the
+    stamp is read at most once every check_interval seconds.
+
+    The lock is reentrant because the loader may itself invalidate the cache:
+    CMSSettings.get_settings() creating the row fires the save signal, whose
+    on_commit hook runs immediately outside a transaction.
+    """
+
+    def __init__(self, name, loader, ttl, check_interval):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._value = None
+        self._version = None
+        self._loaded_at = None
+        self._checked_at = None
+
+    def get(self):
+        with self._lock:
+            current = time.monotonic()
+            if self._loaded_at is not None and current - self._loaded_at < self.ttl:
+                if current - self._checked_at < self.check_interval:
+                    return self._value
+                version = get_version(self.name)
+                self._checked_at = current
+                if version == self._version:
+                    return self._value
+            else:
+                version = get_version(self.name)
+
+            self._value = self.loader()
+            self._version = version
+            self._loaded_at = self._checked_at = current
+            return self._value
+
+    def peek(self):
+        """Return the cached value without loading or revalidating it, or None"""
+        with self._lock:
+            return self._value if self._loaded_at is not None else None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
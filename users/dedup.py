@@ -0,0 +1,98 @@
+"""
+Duplicate suppression for public lead submissions.
+
+A lead's fingerprint hashes its normalized email, phone and source page
+(Lead.fingerprint, indexed with created_at). A submission that matches a
+lead created in the last LEAD_DEDUP_WINDOW seconds doesn't create another
+row: the public endpoint reports it as a duplicate, without the existing
+lead's id, and the admin bulk endpoint returns that id. Each process also
+remembers the fingerprints of the leads it created recently, so the usual
+double-click or retry landing on the same worker needs no query.
+
+With LEAD_WRITE_BEHIND the public endpoint doesn't look anything up; the
+drain deduplicates queued submissions against the window before their own
+submission time.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Lead
+
+
+class RecentFingerprints:
+    """Bounded, least-recently-added map of fingerprint -> (lead id, created_at)"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, since):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+        if entry is not None and entry[1] >= since:
+            return entry[0]
+        return None
+
+    def add(self, fingerprint, lead_id, created_at):
+        with self._lock:
+            self._entries[fingerprint] = (lead_id, created_at)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, fingerprint):
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+
+recent = RecentFingerprints(settings.LEAD_DEDUP_CACHE_SIZE)
+
+
+def enabled():
+    return settings.LEAD_DEDUP_WINDOW > 0
+
+
+def find_duplicates(fingerprints, now=None):
+    """
+    Map each fingerprint that matches a lead created within the window
+    before now (the current time by default) to the id of the earliest such
+    lead
+    """
+    if not enabled():
+        return {}
+
+    since = (now or timezone.now()) - timedelta(seconds=settings.LEAD_DEDUP_WINDOW)
+    found = {}
+    missing = []
+    for fingerprint in set(fingerprints):
+        lead_id = recent.get(fingerprint, since)
+        if lead_id is not None:
+            found[fingerprint] = lead_id
+        else:
+            missing.append(fingerprint)
+
+    if missing:
+        matches = (
+            Lead.objects.filter(fingerprint__in=missing, created_at__gte=since)
+            .order_by('created_at')
+            .values_list('fingerprint', 'id')
+        )
+        for fingerprint, lead_id in matches:
+            found.setdefault(fingerprint, lead_id)
+    return found
+
+
+def find_duplicate(fingerprint):
+    """Id of a lead created within the window with this fingerprint, or None"""
+    return find_duplicates([fingerprint]).get(fingerprint)
+
+
+def remember(leads):
+    """Record newly created leads in this process's recent fingerprints"""
+    for lead in leads:
+        recent.add(lead.fingerprint, lead.id, lead.created_at)
@@ -0,0 +1,99 @@
+"""
+Password hashing off the event loop.
+
+PBKDF2 is CPU-bound, and a burst of logins hashed on the event loop stalls
+every other request served by that ASGI worker. The async login path awaits
+the helpers here instead. They run the hash on a process-wide thread pool of
+LOGIN_HASH_WORKERS threads. hashlib's PBKDF2 releases the GIL, so the pool
+hashes in parallel while the loop keeps serving. At most LOGIN_HASH_MAX_QUEUE
+further checks wait for a free thread; past that HashQueueFull is raised and
+the login is answered with 503 rather than building an unbounded backlog.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashQueueFull(Exception):
+    """Raised when the pool is busy and LOGIN_HASH_MAX_QUEUE checks already wait"""
+
+
+class HashExecutor:
+    """A bounded thread pool that keeps counts for the login queue metric"""
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0  # submitted and not finished: running plus queued
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='login-hash'
+                )
+            return self._executor
+
+    @property
+    def queue_depth(self):
+        """Number of checks waiting for a free thread"""
+        return max(0, self.pending - self.max_workers)
+
+    def stats(self):
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'running': min(self.pending, self.max_workers),
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+    async def run(self, func, *args):
+        """Run func(*args) on the pool and return its result"""
+        executor = self._get_executor()
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HashQueueFull()
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(func, *args))
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+
+executor = HashExecutor(settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_MAX_QUEUE)
+
+
+def _check(password, encoded):
+    must_update = []
+    is_correct = hashers.check_password(
+        password, encoded, setter=lambda raw_password: must_update.append(True)
+    )
+    return is_correct, bool(must_update)
+
+
+async def check_password(password, encoded):
+    """
+    Check password against an encoded hash on the pool. Returns
+    (is_correct, must_update); must_update is True when the hash uses
+    outdated hasher settings and should be replaced.
+    """
+    return await executor.run(_check, password, encoded)
+
+
+async def make_password(password):
+    """Hash password with the default hasher on the pool"""
+    return await executor.run(hashers.make_password, password)
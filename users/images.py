@@ -0,0 +1,194 @@
+"""
+Responsive variants of uploaded images.
+
+Every image field listed in IMAGE_FIELDS gets resized copies at the widths
+in IMAGE_VARIANT_WIDTHS (never wider than the upload), each as WebP and as
+JPEG, stored next to the upload under variants/. The JSON field
+<field>_variants records them:
+
+    {'source': 'properties/villa.jpg', 'width': 4032, 'height': 3024,
+     'webp': {'320': 'properties/variants/villa.jpg-320w.webp', ...},
+     'jpeg': {'320': 'properties/variants/villa.jpg-320w.jpg', ...}}
+
+The save signal (see signals.py) hands a new or replaced upload to a pool of
+IMAGE_VARIANT_WORKERS processes once it is committed, so resizing a
+multi-MB photo doesn't hold up the request or the GIL; the result is
+written back with update(), along with updated_at so that ETags change,
+when the image is still the one that was rendered. `manage.py
+generate_image_variants` covers existing uploads.
+
+This module doesn't import the models so that spawned pool processes can
+import render_variants() without setting Django up.
+"""
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+# (model label, image field); each field has a <field>_variants sibling
+IMAGE_FIELDS = [
+    ('users.CustomUser', 'photo'),
+    ('users.Property', 'img'),
+    ('users.Collaboration', 'img'),
+    ('users.Collaboration', 'logo'),
+    ('users.Slide', 'img'),
+    ('users.YourPerfect', 'img'),
+    ('users.SidebarCard', 'img'),
+    ('users.Hero', 'media'),
+]
+
+# Variant format: (Pillow format, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def image_fields(model=None):
+    """Return (model, field name) pairs, optionally only those of model"""
+    pairs = [(apps.get_model(label), field_name) for label, field_name in IMAGE_FIELDS]
+    return [(m, field_name) for m, field_name in pairs if model is None or m is model]
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def variant_prefix(name):
+    """
+    Storage name that the variants of the image stored as name start with.
+    The upload's extension is kept, so villa.jpg and villa.png in the same
+    directory don't share variants.
+    """
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', filename)
+
+
+def needs_variants(instance, field_name):
+    """Whether instance's image has no variants yet, or variants of an older upload"""
+    name = getattr(instance, field_name).name
+    return bool(name) and getattr(instance, variants_field(field_name)).get('source') != name
+
+
+def _for_jpeg(image):
+    from PIL import Image
+
+    if image.mode in ('RGB', 'L'):
+        return image
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source_path, target_prefix, widths):
+    """
+    Write the variants of the image at source_path as
+    <target_prefix>-<width>w.<ext>. Runs in a pool process. Returns
+    (width, height, variant widths) of the upload.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale while reading (both sides stay at
+        # least the widest variant, whatever the EXIF orientation)
+        image.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        width, height = image.size
+
+        sizes = sorted({min(size, width) for size in widths}, reverse=True)
+        os.makedirs(os.path.dirname(target_prefix), exist_ok=True)
+        resized = image
+        for size in sizes:
+            # Each variant is resized from the next wider one
+            if size != resized.width:
+                resized = resized.resize((size, max(1, round(height * size / width))), Image.LANCZOS)
+            for pil_format, extension, options in FORMATS.values():
+                output = _for_jpeg(resized) if pil_format == 'JPEG' else resized
+                output.save(f'{target_prefix}-{size}w.{extension}', pil_format, **options)
+
+    return width, height, sorted(sizes)
+
+
+def build_variants(name, result):
+    """The <field>_variants value for the image stored as name from render_variants()"""
+    width, height, sizes = result
+    prefix = variant_prefix(name)
+    variants = {'source': name, 'width': width, 'height': height}
+    for key, (_, extension, _) in FORMATS.items():
+        variants[key] = {str(size): f'{prefix}-{size}w.{extension}' for size in sizes}
+    return variants
+
+
+def render_args(model, field_name, name):
+    """Arguments of render_variants() for the image stored as name"""
+    storage = model._meta.get_field(field_name).storage
+    return storage.path(name), storage.path(variant_prefix(name)), settings.IMAGE_VARIANT_WIDTHS
+
+
+def save_variants(model, pk, field_name, name, result):
+    """Record the variants unless the image was replaced in the meantime"""
+    variants = build_variants(name, result)
+    values = {variants_field(field_name): variants}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        # update() skips auto_now, and the conditional GET validators are
+        # built from updated_at
+        values['updated_at'] = timezone.now()
+    updated = model.objects.filter(pk=pk, **{field_name: name}).update(**values)
+    if updated:
+        # update() skips the save signals that rebuild the homepage payload
+        bump_version('public_home')
+    return variants
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=None):
+    """The process-wide pool (spawned, so the children don't inherit threads or connections)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers or settings.IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule(model, pk, field_name, name):
+    """
+    Render the variants of an image in the pool and store them when done;
+    with IMAGE_VARIANT_WORKERS = 0 they are rendered in the calling thread.
+    Either way a failure (e.g. a corrupt upload) is logged, not raised.
+    """
+    args = render_args(model, field_name, name)
+    if not settings.IMAGE_VARIANT_WORKERS:
+        try:
+            return save_variants(model, pk, field_name, name, render_variants(*args))
+        except Exception:
+            logger.exception('Could not generate variants of %s', name)
+            return None
+
+    def finish(future):
+        try:
+            save_variants(model, pk, field_name, name, future.result())
+        except Exception:
+            logger.exception('Could not generate variants of %s', name)
+
+    get_executor().submit(render_variants, *args).add_done_callback(finish)
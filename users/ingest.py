@@ -0,0 +1,118 @@
+"""
+Bulk lead ingestion.
+
+bulk_create() skips Lead.save() and the post_save receivers in signals.py,
+so create_leads() does their work itself, batched: it fills the normalized
+contact columns and fingerprint, skips duplicates of recent leads, assigns
+the new leads to agents (see users/assignment.py), and adds them to the daily
+rollup and the search index.
+"""
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ParseError, ValidationError
+
+from . import dedup, search
+from .assignment import engine as assignment_engine
+from .models import Lead, LeadDailyStat
+from .serializers import PublicLeadSerializer
+
+
+def create_leads(rows, batch_size=None):
+    """
+    Create leads from validated PublicLeadSerializer data in one transaction.
+    Returns a (lead_id, created) pair per row, in order: a row duplicating a
+    recent lead (see users/dedup.py) or an earlier row gets that lead's id
+    and created=False. A row may carry created_at (e.g. the submission time
+    of a queued lead) to replace the insert time.
+    """
+    rows = [dict(row) for row in rows]
+    created_at = [row.pop('created_at', None) for row in rows]
+    leads = [Lead(**row) for row in rows]
+    for lead in leads:
+        lead.normalize_contact_fields()
+
+    # Queued submissions are matched against the window before the earliest
+    # of them, not before the drain
+    submitted = [timestamp for timestamp in created_at if timestamp is not None]
+    existing = dedup.find_duplicates(
+        [lead.fingerprint for lead in leads], now=min(submitted, default=None)
+    )
+    first_by_fingerprint = {}
+    new_leads, backdated = [], []
+    for lead, timestamp in zip(leads, created_at):
+        if dedup.enabled():
+            if lead.fingerprint in existing or lead.fingerprint in first_by_fingerprint:
+                continue
+            first_by_fingerprint[lead.fingerprint] = lead
+        new_leads.append(lead)
+        if timestamp is not None:
+            backdated.append((lead, timestamp))
+
+    batch_size = batch_size or settings.BULK_LEAD_CHUNK_SIZE
+    if new_leads:
+        # Before the insert, so the rollup rows below include the agent
+        assigned = assignment_engine.assign_new_leads(new_leads)
+        with transaction.atomic():
+            Lead.objects.bulk_create(new_leads, batch_size=batch_size)
+            # auto_now_add always stamps the insert time, so backdate afterwards
+            for lead, timestamp in backdated:
+                lead.created_at = timestamp
+            Lead.objects.bulk_update(
+                [lead for lead, _ in backdated], ['created_at'], batch_size=batch_size
+            )
+            for key, count in Counter(lead.stats_key() for lead in new_leads).items():
+                LeadDailyStat.adjust(key, count)
+            if search.fts_enabled():
+                search.index_new_leads(new_leads)
+            transaction.on_commit(lambda: dedup.remember(new_leads))
+            transaction.on_commit(partial(assignment_engine.leads_added, assigned))
+
+        for lead in new_leads:
+            lead._loaded_stats_key = lead.stats_key()
+
+    results = []
+    for lead in leads:
+        if lead.fingerprint in existing:
+            results.append((existing[lead.fingerprint], False))
+        else:
+            first = first_by_fingerprint.get(lead.fingerprint, lead)
+            results.append((first.id, first is lead))
+    return results
+
+
+def ingest_leads(rows, chunk_size=None):
+    """
+    Validate rows (dicts in the PublicLeadSerializer shape) and create the
+    valid ones, chunk_size rows per transaction. Returns one result per row,
+    in order: {'index', 'lead_id', 'duplicate'} or {'index', 'errors'}.
+    """
+    chunk_size = chunk_size or settings.BULK_LEAD_CHUNK_SIZE
+    # One serializer validates every row, instead of building its fields per row
+    serializer = PublicLeadSerializer()
+    rows = enumerate(rows)
+    results = []
+
+    while chunk := list(islice(rows, chunk_size)):
+        valid, valid_results = [], []
+        for index, row in chunk:
+            result = {'index': index}
+            results.append(result)
+            if isinstance(row, ParseError):
+                result['errors'] = {'non_field_errors': [row.detail]}
+                continue
+            try:
+                valid.append(serializer.run_validation(row))
+            except ValidationError as exc:
+                result['errors'] = exc.detail
+            else:
+                valid_results.append(result)
+
+        for result, (lead_id, created) in zip(valid_results, create_leads(valid, chunk_size)):
+            result['lead_id'] = lead_id
+            result['duplicate'] = not created
+
+    return results
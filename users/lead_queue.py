@@ -0,0 +1,70 @@
+"""
+Write-behind queue for public lead submissions.
+
+With LEAD_WRITE_BEHIND enabled, PublicLeadViewSet.create validates a
+submission, appends it here and answers 202 without touching the main
+database, so form posts don't wait on its write lock during campaign
+spikes. The queue is a separate SQLite journal (LEAD_QUEUE_PATH) in WAL mode
+with synchronous=FULL: a submission is on disk once enqueue() returns.
+
+`manage.py drain_lead_queue` moves queued submissions into Lead in batched
+transactions. Run a single drain worker. Delivery is at least once: a
+drain that stops after creating a batch but before removing it from the
+queue creates that batch again on the next run.
+"""
+import json
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+_local = threading.local()
+
+
+def _get_connection():
+    """Per-thread connection to the queue journal, created on first use"""
+    path = settings.LEAD_QUEUE_PATH
+    if getattr(_local, 'path', None) != path:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS lead_queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)'
+        )
+        _local.connection, _local.path = connection, path
+    return _local.connection
+
+
+def enqueue(data):
+    """Append validated PublicLeadSerializer data, stamped with the submission time"""
+    payload = dict(data, created_at=timezone.now())
+    _get_connection().execute(
+        'INSERT INTO lead_queue (payload) VALUES (?)',
+        [json.dumps(payload, cls=DjangoJSONEncoder)],
+    )
+
+
+def peek(limit):
+    """Return up to limit of the oldest submissions as (queue id, row) pairs"""
+    rows = _get_connection().execute(
+        'SELECT id, payload FROM lead_queue ORDER BY id LIMIT ?', [limit]
+    ).fetchall()
+    batch = []
+    for queue_id, payload in rows:
+        row = json.loads(payload)
+        row['created_at'] = parse_datetime(row['created_at'])
+        batch.append((queue_id, row))
+    return batch
+
+
+def remove_through(queue_id):
+    """Drop every submission up to and including queue_id"""
+    _get_connection().execute('DELETE FROM lead_queue WHERE id <= ?', [queue_id])
+
+
+def size():
+    return _get_connection().execute('SELECT COUNT(*) FROM lead_queue').fetchone()[0]
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from users.models import Lead, lead_fingerprint, normalize_email, normalize_phone
+
+
+class Command(BaseCommand):
+    help = 'Fill the normalized phone and email lookup columns and the fingerprint of existing leads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Number of leads read and updated per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+
+        while True:
+            batch = list(
+                Lead.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'phone', 'email', 'source_page', 'phone_normalized', 'email_normalized', 'fingerprint')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            changed = []
+            for lead in batch:
+                phone = normalize_phone(lead.phone)
+                email = normalize_email(lead.email)
+                fingerprint = lead_fingerprint(lead.email, lead.phone, lead.source_page)
+                if (phone, email, fingerprint) != (lead.phone_normalized, lead.email_normalized, lead.fingerprint):
+                    lead.phone_normalized = phone
+                    lead.email_normalized = email
+                    lead.fingerprint = fingerprint
+                    changed.append(lead)
+            Lead.objects.bulk_update(changed, ['phone_normalized', 'email_normalized', 'fingerprint'])
+            updated += len(changed)
+
+        self.stdout.write(self.style.SUCCESS(f'Normalized contact fields and fingerprints on {updated} leads'))
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from users.benchmarks import median_ms, scratch_database, seed_agents, seed_leads
+from users.models import Deal, Lead, LeadNote
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the hot Lead and Deal queries on a scratch database, '
+        'without and with the composite indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=1000000, help='Number of leads to seed')
+        parser.add_argument('--agents', type=int, default=50, help='Number of agents to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query (median is reported)')
+
+    def get_queries(self, agent_id):
+        """Representative queries issued by the lead, analytics and revenue views"""
+        now = timezone.now()
+        last_week = now - timedelta(days=7)
+        last_month = now - timedelta(days=30)
+        leads = Lead.objects.order_by('-created_at', '-id')
+        return [
+            ('admin list, status filter',
+             lambda: list(leads.filter(status='new')[:50])),
+            ('admin list, traffic_source filter',
+             lambda: list(leads.filter(traffic_source='google')[:50])),
+            ('admin list, utm_campaign filter',
+             lambda: list(leads.filter(utm_campaign='campaign-7')[:50])),
+            ('agent list, status filter',
+             lambda: list(leads.filter(assigned_agent_id=agent_id, status='contacted')[:50])),
+            ('agent analytics, date range by status',
+             lambda: list(
+                 Lead.objects.filter(assigned_agent_id=agent_id, created_at__gte=last_month)
+                 .values('status').annotate(count=Count('id')).order_by()
+             )),
+            ('agent recent activity',
+             lambda: list(
+                 Lead.objects.filter(assigned_agent_id=agent_id, updated_at__gte=last_week)
+                 .order_by('-updated_at').values('id', 'status', 'updated_at')[:5]
+             )),
+            ('created_at range count',
+             lambda: Lead.objects.filter(created_at__gte=last_month).count()),
+            ('deals by closed_date range',
+             lambda: Deal.objects.filter(closed_date__gte=last_month.date())
+             .aggregate(total=Sum('revenue_amount'))),
+            ('agent deals revenue',
+             lambda: Deal.objects.filter(lead__assigned_agent_id=agent_id)
+             .aggregate(total=Sum('revenue_amount'))),
+        ]
+
+    def set_indexes(self, enabled):
+        with connection.schema_editor() as editor:
+            for model in (Lead, LeadNote, Deal):
+                for index in model._meta.indexes:
+                    if enabled:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write(f"Seeding {options['leads']} leads...")
+            agent_ids = seed_agents(options['agents'])
+            seed_leads(options['leads'], agent_ids)
+            queries = self.get_queries(agent_ids[0])
+
+            self.set_indexes(False)
+            before = [median_ms(query, options['repeat']) for _, query in queries]
+            self.set_indexes(True)
+            after = [median_ms(query, options['repeat']) for _, query in queries]
+
+        width = max(len(name) for name, _ in queries)
+        self.stdout.write(f"{'query'.ljust(width)}  {'before ms':>10}  {'after ms':>10}  {'speedup':>8}")
+        for (name, _), before_ms, after_ms in zip(queries, before, after):
+            speedup = before_ms / after_ms if after_ms else float('inf')
+            self.stdout.write(
+                f'{name.ljust(width)}  {before_ms:10.2f}  {after_ms:10.2f}  {speedup:7.1f}x'
+            )
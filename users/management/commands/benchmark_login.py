@@ -0,0 +1,106 @@
+import random
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.test import Client, override_settings
+
+from users.benchmarks import scratch_database
+from users.models import CustomUser
+
+
+class LegacyEmailBackend(ModelBackend):
+    """The previous EmailBackend lookup (email OR username), kept for comparison"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            user = CustomUser.objects.get(Q(email=username) | Q(username=username))
+            if user.check_password(password):
+                return user
+        except CustomUser.DoesNotExist:
+            return None
+        return None
+
+
+class IexactEmailBackend(ModelBackend):
+    """A case-insensitive lookup without the LOWER(email) index"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = CustomUser.objects.filter(Q(email__iexact=username) | Q(username=username)).first()
+        if user is not None and user.check_password(password):
+            return user
+        return None
+
+
+BACKENDS = [
+    ('before (email OR username)', 'users.management.commands.benchmark_login.LegacyEmailBackend'),
+    ('iexact, no index', 'users.management.commands.benchmark_login.IexactEmailBackend'),
+    ('after (LOWER(email) index)', 'users.authentication.EmailBackend'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark /api/login/ throughput on a scratch database with a large user '
+        'table, using the previous and the current EmailBackend lookups'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200000, help='Number of users to seed')
+        parser.add_argument('--requests', type=int, default=500, help='Login requests per run')
+
+    def seed_users(self, count, password_hash):
+        for offset in range(0, count, 10000):
+            CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=f'bench-user-{i}',
+                    email=f'bench-user-{i}@example.com',
+                    password=password_hash,
+                    role='agent',
+                )
+                for i in range(offset, min(offset + 10000, count))
+            ])
+
+    def run_logins(self, client, emails):
+        """Return (requests per second, share of successful logins)"""
+        succeeded = 0
+        start = time.perf_counter()
+        for email in emails:
+            response = client.post('/api/login/', {'email': email, 'password': 'bench-password'},
+                                   content_type='application/json')
+            succeeded += response.status_code == 200
+        return len(emails) / (time.perf_counter() - start), succeeded / len(emails)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        count = options['users']
+        hits = [f'bench-user-{rng.randrange(count)}@example.com' for _ in range(options['requests'])]
+        misses = [f'missing-{i}@example.com' for i in range(options['requests'])]
+        mixed_case = [email.capitalize() for email in hits]
+
+        # A fast hasher keeps the measurement about the user lookup rather
+        # than PBKDF2, which costs the same with either backend
+        with override_settings(
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            ALLOWED_HOSTS=['testserver'],
+        ):
+            with scratch_database():
+                self.stdout.write(f'Seeding {count} users...')
+                self.seed_users(count, make_password('bench-password'))
+                client = Client()
+
+                self.stdout.write(
+                    f"{'backend'.ljust(28)}  {'hits req/s':>10}  {'misses req/s':>12}  "
+                    f"{'mixed-case req/s':>16}  {'mixed-case ok':>13}"
+                )
+                for label, backend in BACKENDS:
+                    with override_settings(AUTHENTICATION_BACKENDS=[backend]):
+                        hit_rate, _ = self.run_logins(client, hits)
+                        miss_rate, _ = self.run_logins(client, misses)
+                        mixed_rate, mixed_ok = self.run_logins(client, mixed_case)
+                    self.stdout.write(
+                        f'{label.ljust(28)}  {hit_rate:10.0f}  {miss_rate:12.0f}  '
+                        f'{mixed_rate:16.0f}  {mixed_ok:12.0%}'
+                    )
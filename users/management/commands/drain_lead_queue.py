@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import lead_queue
+from users.ingest import create_leads
+
+
+class Command(BaseCommand):
+    help = 'Create leads from the public submissions waiting in the write-behind queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.BULK_LEAD_CHUNK_SIZE,
+            help='Number of submissions created per transaction'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep draining, polling the queue every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds between polls with --loop'
+        )
+
+    def drain(self, batch_size):
+        drained = 0
+        while batch := lead_queue.peek(batch_size):
+            create_leads([row for _, row in batch], batch_size)
+            lead_queue.remove_through(batch[-1][0])
+            drained += len(batch)
+        return drained
+
+    def handle(self, *args, **options):
+        while True:
+            drained = self.drain(options['batch_size'])
+            if drained or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Created {drained} queued leads'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
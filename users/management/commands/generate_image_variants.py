@@ -0,0 +1,72 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import images
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized WebP/JPEG variants of uploaded images that have none or outdated ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.IMAGE_VARIANT_WORKERS or 1,
+            help='Number of processes resizing images (0 resizes in this process)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate the variants of every image, e.g. after changing IMAGE_VARIANT_WIDTHS'
+        )
+
+    def pending(self, force):
+        """Yield (model, pk, field name, image name) for every image to process"""
+        for model, field_name in images.image_fields():
+            rows = (
+                model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+                .values_list('pk', field_name, images.variants_field(field_name))
+                .iterator()
+            )
+            for pk, name, variants in rows:
+                if force or (variants or {}).get('source') != name:
+                    yield model, pk, field_name, name
+
+    def results(self, jobs, workers):
+        """Yield (job, function returning its render_variants() result) as jobs finish"""
+        if workers == 0:
+            for job in jobs:
+                model, _, field_name, name = job
+                yield job, partial(images.render_variants, *images.render_args(model, field_name, name))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {}
+            for job in jobs:
+                model, _, field_name, name = job
+                futures[pool.submit(images.render_variants, *images.render_args(model, field_name, name))] = job
+            for future in as_completed(futures):
+                yield futures[future], future.result
+
+    def handle(self, *args, **options):
+        jobs = list(self.pending(options['force']))
+        done = failed = 0
+
+        for (model, pk, field_name, name), result in self.results(jobs, options['workers']):
+            try:
+                rendered = result()
+            except OSError as exc:
+                # Missing or unreadable upload
+                self.stderr.write(f'{model.__name__} {pk}: {name}: {exc}')
+                failed += 1
+                continue
+            images.save_variants(model, pk, field_name, name, rendered)
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {done} images' + (f' ({failed} could not be read)' if failed else '')
+        ))
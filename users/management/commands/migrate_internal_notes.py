@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from users import search
+from users.models import CustomUser, Lead, LeadNote
+
+
+def parse_timestamp(value):
+    """Return an aware datetime for an ISO timestamp written by the old Lead.add_note(), or None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def legacy_notes(blob):
+    """
+    Yield (timestamp, author, text) for each note in an internal_notes value:
+    the {timestamp: {'note', 'author', 'timestamp'}} dict that add_note()
+    wrote, or free-form text, lists and dicts written through the API
+    """
+    if not blob:
+        return
+    if isinstance(blob, dict):
+        items = blob.items()
+    elif isinstance(blob, list):
+        items = ((None, value) for value in blob)
+    else:
+        items = [(None, blob)]
+
+    for key, value in items:
+        if isinstance(value, dict) and 'note' in value:
+            timestamp = parse_timestamp(value.get('timestamp')) or parse_timestamp(key)
+            author, text = value.get('author'), value['note']
+        else:
+            timestamp, author, text = parse_timestamp(key), None, value
+            if key is not None and timestamp is None:
+                text = f'{key}: {text}'
+        if text in (None, ''):
+            continue
+        yield timestamp, author, text if isinstance(text, str) else json.dumps(text)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the notes kept in the legacy Lead.internal_notes blob into LeadNote rows, '
+        'in batches, and clear the blob'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of leads read and migrated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        migrated_leads = 0
+        migrated_notes = 0
+
+        while True:
+            batch = list(
+                Lead.objects.filter(id__gt=last_id, internal_notes__isnull=False)
+                .order_by('id')
+                .values_list('id', 'internal_notes', 'updated_at')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            entries = [
+                (lead_id, timestamp or updated_at, author, text)
+                for lead_id, blob, updated_at in batch
+                for timestamp, author, text in legacy_notes(blob)
+            ]
+            # add_note() stored the author as a name; keep it on the note
+            # text unless it is the username of an existing user
+            users = CustomUser.objects.in_bulk(
+                {author for _, _, author, _ in entries if author and author != 'System'},
+                field_name='username'
+            )
+            notes = []
+            for lead_id, timestamp, author, text in sorted(entries, key=lambda entry: (entry[0], entry[1])):
+                user = users.get(author)
+                if author and author != 'System' and user is None:
+                    text = f'{author}: {text}'
+                notes.append(LeadNote(lead_id=lead_id, user=user, note=text, created_at=timestamp))
+
+            with transaction.atomic():
+                # auto_now_add overwrites created_at on insert, so restore it afterwards
+                timestamps = [note.created_at for note in notes]
+                LeadNote.objects.bulk_create(notes)
+                for note, timestamp in zip(notes, timestamps):
+                    note.created_at = timestamp
+                LeadNote.objects.bulk_update(notes, ['created_at'])
+                # update() leaves updated_at alone
+                Lead.objects.filter(id__in=[lead_id for lead_id, _, _ in batch]).update(internal_notes=None)
+                if search.fts_enabled():
+                    for lead_id in {note.lead_id for note in notes}:
+                        search.index_lead_notes(lead_id)
+
+            migrated_leads += len({note.lead_id for note in notes})
+            migrated_notes += len(notes)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Moved {migrated_notes} notes of {migrated_leads} leads into LeadNote')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text lead search index from the Lead and LeadNote tables'
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            self.stdout.write(
+                self.style.WARNING('Full-text lead search is disabled or unsupported on this database')
+            )
+            return
+
+        rows = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt lead search index ({rows} leads)'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from users.models import LeadDailyStat
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily lead statistics rollup from the Lead table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rollup rows written per INSERT'
+        )
+
+    def handle(self, *args, **options):
+        rows = LeadDailyStat.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt lead statistics rollup ({rows} rows)')
+        )
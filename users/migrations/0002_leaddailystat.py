@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_lead_stats(apps, schema_editor):
+    Lead = apps.get_model('users', 'Lead')
+    LeadDailyStat = apps.get_model('users', 'LeadDailyStat')
+    rows = (
+        Lead.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'assigned_agent_id', 'status', 'traffic_source')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    LeadDailyStat.objects.bulk_create(
+        (LeadDailyStat(**row) for row in rows.iterator(chunk_size=1000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the leads were created')),
+                ('status', models.CharField(choices=[('new', 'New'), ('contacted', 'Contacted'), ('in_progress', 'In Progress'), ('converted', 'Converted'), ('closed_lost', 'Closed Lost')], max_length=20)),
+                ('traffic_source', models.CharField(blank=True, max_length=225, null=True)),
+                ('count', models.IntegerField(default=0)),
+                ('assigned_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lead_daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lead Daily Stat',
+                'verbose_name_plural': 'Lead Daily Stats',
+                'indexes': [models.Index(fields=['day', 'assigned_agent'], name='users_leadstat_day_agent_idx'), models.Index(fields=['assigned_agent', 'day'], name='users_leadstat_agent_day_idx')],
+            },
+        ),
+        migrations.RunPython(populate_lead_stats, migrations.RunPython.noop),
+    ]
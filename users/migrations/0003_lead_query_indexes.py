@@ -0,0 +1,45 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_leaddailystat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['closed_date'], name='users_deal_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['created_at', 'id'], name='users_lead_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['status', 'created_at'], name='users_lead_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['assigned_agent', 'status', 'created_at'], name='users_lead_agent_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['assigned_agent', 'updated_at'], name='users_lead_agent_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['traffic_source', 'created_at'], name='users_lead_traffic_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['utm_campaign', 'created_at'], name='users_lead_campaign_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadnote',
+            index=models.Index(fields=['lead', 'created_at'], name='users_leadnote_lead_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# The index as created here; users/search.py maintains it from then on. The
+# SQL is kept inline so that this migration doesn't change with that module.
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_lead_search "
+    "USING fts5(name, email, phone, source_page, notes, tokenize='trigram')"
+)
+
+POPULATE_INDEX = """
+    INSERT INTO users_lead_search (rowid, name, email, phone, source_page, notes)
+    SELECT lead.id, lead.name, lead.email, COALESCE(lead.phone, ''),
+           COALESCE(lead.source_page, ''),
+           COALESCE((SELECT GROUP_CONCAT(note.note, ' ')
+                     FROM users_leadnote note WHERE note.lead_id = lead.id), '')
+    FROM users_lead lead
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(POPULATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS users_lead_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_lead_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
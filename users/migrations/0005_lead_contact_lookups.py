@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_lead_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='email_normalized',
+            field=models.CharField(blank=True, editable=False, help_text='Lower-cased email for exact lookups', max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, help_text='E.164-style phone for exact lookups', max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['phone_normalized'], name='users_lead_phone_norm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['email_normalized'], name='users_lead_email_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:38
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0005_lead_contact_lookups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='users_customuser_email_ci_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of email, phone and source page for duplicate detection', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['fingerprint', 'created_at'], name='users_lead_fingerprint_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_lead_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lead',
+            name='internal_notes',
+            field=models.JSONField(blank=True, default=dict, help_text='Legacy notes blob; notes are LeadNote rows (see migrate_internal_notes)', null=True),
+        ),
+    ]
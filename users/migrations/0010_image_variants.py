@@ -0,0 +1,53 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_lead_internal_notes_legacy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collaboration',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='collaboration',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='hero',
+            name='media_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='sidebarcard',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+        migrations.AddField(
+            model_name='yourperfect',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized variants (see users/images.py)'),
+        ),
+    ]
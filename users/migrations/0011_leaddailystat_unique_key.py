@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:52
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+KEY_FIELDS = ('day', 'assigned_agent_id', 'status', 'traffic_source')
+
+
+def merge_duplicate_stats(apps, schema_editor):
+    """Sum rows that concurrent first writes created twice for the same key"""
+    LeadDailyStat = apps.get_model('users', 'LeadDailyStat')
+    duplicates = (
+        LeadDailyStat.objects
+        .values(*KEY_FIELDS)
+        .annotate(rows=Count('id'), total=Sum('count'), keep=Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in list(duplicates):
+        key = {field: row[field] for field in KEY_FIELDS}
+        LeadDailyStat.objects.filter(**key).exclude(pk=row['keep']).delete()
+        LeadDailyStat.objects.filter(pk=row['keep']).update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leaddailystat',
+            constraint=models.UniqueConstraint(models.F('day'), models.F('status'), django.db.models.functions.comparison.Coalesce('assigned_agent', models.Value(0), output_field=models.BigIntegerField()), django.db.models.functions.comparison.Coalesce('traffic_source', models.Value('')), models.ExpressionWrapper(models.Q(('traffic_source__isnull', True)), output_field=models.BooleanField()), name='users_leadstat_key_uniq'),
+        ),
+    ]
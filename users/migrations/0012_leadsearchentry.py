@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 20:13
+
+import django.db.models.deletion
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_leaddailystat_unique_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadSearchEntry',
+            fields=[
+                ('lead', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='users.lead')),
+                ('document', users.models.FullTextField(db_column='users_lead_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'users_lead_search',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
+from django.conf import settings as django_settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import CharField, Count, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce, Concat, Lower, NullIf, Trim, TruncDate
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from decimal import Decimal
+import hashlib
+import re
+from .cache import VersionedLocalCache, bump_version
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
@@ -17,6 +24,7 @@ class CustomUser(AbstractUser):
     
     # Agent profile fields
     photo = models.ImageField(upload_to='agents/photos/', null=True, blank=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     title = models.CharField(max_length=100, null=True, blank=True)
     phone = models.CharField(max_length=20, null=True, blank=True)
     bio = models.TextField(null=True, blank=True)
@@ -26,8 +34,23 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'  
     REQUIRED_FIELDS = ['username']  
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive email lookups at login (see EmailBackend)
+            models.Index(Lower('email'), name='users_customuser_email_ci_idx'),
+        ]
+
     def __str__(self):
         return self.email
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Users resolved by CachedJWTAuthentication carry only a few fields;
+        # when a deferred one is read, load all of them in one query rather
+        # than one query per field
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
     
     @property
     def is_admin_role(self):
@@ -50,6 +73,7 @@ class Property(models.Model):
     location = models.CharField(max_length=255)
     price = models.CharField(max_length=100)
     img = models.ImageField(upload_to='properties/', null=True, blank=True)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -62,7 +86,9 @@ class Collaboration(models.Model):
     title = models.CharField(max_length=255)
     desc = models.TextField()
     img = models.ImageField(upload_to='collaborations/', null=True, blank=True) 
+    img_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     logo = models.ImageField(upload_to='collaborations/logos/', null=True, blank=True)  
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -75,6 +101,7 @@ class Slide(models.Model):
     title = models.CharField(max_length=255)
     location = models.CharField(max_length=255)
     img = models.ImageField(upload_to='slides/', null=True, blank=True)  
+    img_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     points = models.JSONField(default=list)  
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -87,6 +114,7 @@ class YourPerfect(models.Model):
     title = models.CharField(max_length=255)
     price = models.CharField(max_length=100)
     img = models.ImageField(upload_to='yourperfect/', null=True, blank=True) 
+    img_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -99,6 +127,7 @@ class SidebarCard(models.Model):
     title = models.CharField(max_length=255)
     desc = models.TextField() 
     img = models.ImageField(upload_to='sidebarcard/', null=True, blank=True)  
+    img_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -160,6 +189,28 @@ class CMSSettings(models.Model):
         )
         return settings
 
+    @classmethod
+    def get_cached_settings(cls):
+        """
+        Get settings from the per-process cache (read-only; use get_settings()
+        for an instance you intend to modify)
+        """
+        return _cms_settings_cache.get()
+
+    @classmethod
+    def clear_cached_settings(cls):
+        """Drop the cached settings in this process and in every other worker"""
+        bump_version('cms_settings')
+        _cms_settings_cache.invalidate()
+
+
+_cms_settings_cache = VersionedLocalCache(
+    'cms_settings',
+    CMSSettings.get_settings,
+    ttl=django_settings.CMS_SETTINGS_CACHE_TTL,
+    check_interval=django_settings.CMS_SETTINGS_VERSION_CHECK_INTERVAL,
+)
+
 
 class Hero(models.Model):
     """
@@ -176,6 +227,7 @@ class Hero(models.Model):
     cta_text = models.CharField(max_length=200, null=True, blank=True)
     cta_link = models.URLField(max_length=500, null=True, blank=True)
     media = models.ImageField(upload_to='hero/', null=True, blank=True)
+    media_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized variants (see users/images.py)")
     video = models.URLField(max_length=500, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
@@ -194,6 +246,79 @@ class Hero(models.Model):
         return dict(self.TYPE_CHOICES).get(self.type, self.type)
 
 
+def normalize_phone(phone):
+    """
+    Return phone in E.164 style ('+' followed by digits), or None. Numbers in
+    national format (leading trunk 0) get settings.LEAD_DEFAULT_COUNTRY_CODE.
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if not digits:
+        return None
+    if not phone.startswith('+'):
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif digits.startswith('0'):
+            digits = django_settings.LEAD_DEFAULT_COUNTRY_CODE + digits[1:]
+    return f'+{digits}'
+
+
+def normalize_email(email):
+    """Return a trimmed, lower-cased email, or None"""
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+def lead_fingerprint(email, phone, source_page):
+    """Hash of the normalized contact details and source page (see users/dedup.py)"""
+    key = '\x1f'.join([
+        normalize_email(email) or '',
+        normalize_phone(phone) or '',
+        (source_page or '').strip().lower(),
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_display_name(path):
+    """
+    SQL for the related user at path: the full name, else the username, like
+    get_full_name() or username in the serializers; NULL without a user
+    """
+    full_name = Trim(Concat(f'{path}__first_name', Value(' '), f'{path}__last_name', output_field=CharField()))
+    return Coalesce(NullIf(full_name, Value('')), f'{path}__username')
+
+
+class LeadQuerySet(models.QuerySet):
+    def with_related(self, notes_limit=None):
+        """
+        Join the assigned agent and prefetch the newest notes_limit notes of
+        each lead (LEAD_NOTES_LIMIT by default, 0 for all) with their authors.
+        The legacy internal_notes blob is deferred.
+        """
+        if notes_limit is None:
+            notes_limit = django_settings.LEAD_NOTES_LIMIT
+        notes = LeadNote.objects.select_related('user').order_by('-created_at', '-id')
+        if notes_limit:
+            notes = notes[:notes_limit]
+        return self.defer('internal_notes').select_related('assigned_agent').prefetch_related(
+            models.Prefetch('notes', queryset=notes, to_attr='prefetched_notes')
+        )
+
+    def export_values(self, *fields):
+        """
+        values() of fields plus the assigned agent's name (full name, else
+        username, as in the serializers) and email, joined in SQL
+        """
+        return self.prefetch_related(None).values(
+            *fields,
+            assigned_agent_name=user_display_name('assigned_agent'),
+            assigned_agent_email=F('assigned_agent__email'),
+        )
+
+
 class Lead(models.Model):
     """
     Lead model for managing customer inquiries and assignments
@@ -205,6 +330,8 @@ class Lead(models.Model):
         ('converted', 'Converted'),
         ('closed_lost', 'Closed Lost'),
     ]
+    # Statuses that still need an agent's attention (see users/assignment.py)
+    OPEN_STATUSES = ('new', 'contacted', 'in_progress')
     
     
     name = models.CharField(max_length=255)
@@ -227,18 +354,76 @@ class Lead(models.Model):
         related_name='assigned_leads',
         limit_choices_to={'role': 'agent'}
     )
-    internal_notes = models.JSONField(default=dict, null=True, blank=True, help_text="Internal notes and activity log")
+    internal_notes = models.JSONField(default=dict, null=True, blank=True, help_text="Legacy notes blob; notes are LeadNote rows (see migrate_internal_notes)")
+
+    # Lookup columns derived from phone/email on save (see normalize_contact_fields)
+    phone_normalized = models.CharField(max_length=32, null=True, blank=True, editable=False, help_text="E.164-style phone for exact lookups")
+    email_normalized = models.CharField(max_length=254, null=True, blank=True, editable=False, help_text="Lower-cased email for exact lookups")
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False, help_text="Hash of email, phone and source page for duplicate detection")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LeadQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Lead"
         verbose_name_plural = "Leads"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='users_lead_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='users_lead_status_idx'),
+            models.Index(fields=['assigned_agent', 'status', 'created_at'], name='users_lead_agent_status_idx'),
+            models.Index(fields=['assigned_agent', 'updated_at'], name='users_lead_agent_updated_idx'),
+            models.Index(fields=['traffic_source', 'created_at'], name='users_lead_traffic_idx'),
+            models.Index(fields=['utm_campaign', 'created_at'], name='users_lead_campaign_idx'),
+            models.Index(fields=['phone_normalized'], name='users_lead_phone_norm_idx'),
+            models.Index(fields=['email_normalized'], name='users_lead_email_norm_idx'),
+            models.Index(fields=['fingerprint', 'created_at'], name='users_lead_fingerprint_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
 
+    STATS_FIELDS = ('created_at', 'assigned_agent_id', 'status', 'traffic_source')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the rollup key as loaded so saves can move counts between rows
+        if not any(field in instance.get_deferred_fields() for field in cls.STATS_FIELDS):
+            instance._loaded_stats_key = instance.stats_key()
+        return instance
+
+    def stats_key(self):
+        """Return the (day, agent, status, traffic_source) key this lead counts under"""
+        return (
+            timezone.localdate(self.created_at),
+            self.assigned_agent_id,
+            self.status,
+            self.traffic_source,
+        )
+
+    def normalize_contact_fields(self):
+        """Fill the normalized phone/email lookup columns and the duplicate fingerprint"""
+        self.phone_normalized = normalize_phone(self.phone)
+        self.email_normalized = normalize_email(self.email)
+        self.fingerprint = lead_fingerprint(self.email, self.phone, self.source_page)
+
+    def save(self, *args, **kwargs):
+        self.normalize_contact_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'phone' in update_fields:
+                update_fields.add('phone_normalized')
+            if 'email' in update_fields:
+                update_fields.add('email_normalized')
+            if update_fields & {'phone', 'email', 'source_page'}:
+                update_fields.add('fingerprint')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     @property
     def is_assigned(self):
         """Check if lead has an assigned agent"""
@@ -249,19 +434,16 @@ class Lead(models.Model):
         """Check if lead can be marked as converted"""
         return self.status in ['in_progress', 'contacted']
 
+    @property
+    def recent_notes(self):
+        """The notes prefetched by with_related(), else the newest LEAD_NOTES_LIMIT"""
+        if hasattr(self, 'prefetched_notes'):
+            return self.prefetched_notes
+        return self.notes.select_related('user').order_by('-created_at', '-id')[:django_settings.LEAD_NOTES_LIMIT]
+
     def add_note(self, note, author=None):
-        """Add a note to internal notes"""
-        if not self.internal_notes:
-            self.internal_notes = {}
-        
-        import datetime
-        timestamp = datetime.datetime.now().isoformat()
-        self.internal_notes[timestamp] = {
-            'note': note,
-            'author': author or 'System',
-            'timestamp': timestamp
-        }
-        self.save()
+        """Append a note by author (a user, or None for the system) to the lead's history"""
+        return LeadNote.objects.create(lead=self, user=author, note=note)
 
     def can_agent_update_status(self, new_status):
         """Check if agent can update to this status"""
@@ -292,11 +474,54 @@ class LeadNote(models.Model):
         verbose_name = "Lead Note"
         verbose_name_plural = "Lead Notes"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['lead', 'created_at'], name='users_leadnote_lead_idx'),
+        ]
     
     def __str__(self):
         return f"Note by {self.user} on {self.lead.name} at {self.created_at}"
 
 
+class FullTextMatch(models.Lookup):
+    """<column> MATCH <query> against an SQLite FTS5 table"""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class FullTextField(models.TextField):
+    """The hidden FTS5 column named after its table, which MATCH is applied to"""
+
+
+FullTextField.register_lookup(FullTextMatch)
+
+
+class LeadSearchEntry(models.Model):
+    """
+    A lead's row in the FTS5 search index, mapped read-only so that searches
+    join it through the ORM. The table is created by migration 0004 and
+    written with raw SQL by users/search.py.
+    """
+    lead = models.OneToOneField(
+        Lead,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_entry'
+    )
+    document = FullTextField(db_column='users_lead_search')
+    # bm25 relevance of the current MATCH, lower is better
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'users_lead_search'
+
+
 class Deal(models.Model):
     """
     Deal model for tracking revenue and commission for converted leads
@@ -357,6 +582,9 @@ class Deal(models.Model):
         verbose_name = "Deal"
         verbose_name_plural = "Deals"
         ordering = ['-closed_date']
+        indexes = [
+            models.Index(fields=['closed_date'], name='users_deal_closed_idx'),
+        ]
 
     def __str__(self):
         return f"Deal for {self.lead.name} - {self.revenue_amount} {self.currency}"
@@ -385,4 +613,117 @@ class Deal(models.Model):
         """Return commission rate as percentage string"""
         if self.commission_rate is not None:
             return f"{self.commission_rate}%"
-        return "Not set"
\ No newline at end of file
+        return "Not set"
+
+
+class LeadDailyStat(models.Model):
+    """
+    Daily lead counts per agent, status and traffic source, kept current
+    incrementally by the Lead signal handlers and used by the analytics views
+    """
+    day = models.DateField(help_text="Day the leads were created")
+    assigned_agent = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='lead_daily_stats'
+    )
+    status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES)
+    traffic_source = models.CharField(max_length=225, blank=True, null=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Lead Daily Stat"
+        verbose_name_plural = "Lead Daily Stats"
+        indexes = [
+            models.Index(fields=['day', 'assigned_agent'], name='users_leadstat_day_agent_idx'),
+            models.Index(fields=['assigned_agent', 'day'], name='users_leadstat_agent_day_idx'),
+        ]
+        constraints = [
+            # One row per (day, agent, status, traffic_source). NULLs are
+            # distinct in a unique index, so the nullable agent and source
+            # are indexed through Coalesce (plus an IS NULL flag keeping a
+            # NULL source apart from '')
+            models.UniqueConstraint(
+                'day',
+                'status',
+                Coalesce('assigned_agent', Value(0), output_field=models.BigIntegerField()),
+                Coalesce('traffic_source', Value('')),
+                ExpressionWrapper(Q(traffic_source__isnull=True), output_field=models.BooleanField()),
+                name='users_leadstat_key_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status} ({self.count})"
+
+    @classmethod
+    def adjust(cls, key, delta):
+        """Add delta to the counter for a (day, agent, status, traffic_source) key"""
+        day, agent_id, status, traffic_source = key
+        counter = cls.objects.filter(
+            day=day,
+            assigned_agent_id=agent_id,
+            status=status,
+            traffic_source=traffic_source,
+        )
+        with transaction.atomic():
+            if counter.update(count=F('count') + delta):
+                return
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        day=day,
+                        assigned_agent_id=agent_id,
+                        status=status,
+                        traffic_source=traffic_source,
+                        count=delta,
+                    )
+            except IntegrityError:
+                # A concurrent first write created the row in the meantime
+                counter.update(count=F('count') + delta)
+
+    @classmethod
+    def unassign(cls, agent_id):
+        """
+        Fold an agent's counters into the unassigned ones. Called before the
+        agent is deleted: SET_NULL would otherwise turn them into duplicates
+        of the existing unassigned rows.
+        """
+        with transaction.atomic():
+            rows = cls.objects.filter(assigned_agent_id=agent_id)
+            for day, status, traffic_source, count in rows.values_list('day', 'status', 'traffic_source', 'count'):
+                cls.adjust((day, None, status, traffic_source), count)
+            rows.delete()
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Recompute every counter from the Lead table"""
+        rows = (
+            Lead.objects
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'assigned_agent_id', 'status', 'traffic_source')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            stats = cls.objects.bulk_create(
+                (cls(**row) for row in rows.iterator(chunk_size=batch_size)),
+                batch_size=batch_size,
+            )
+        return len(stats)
+
+
+class RevokedToken(models.Model):
+    """
+    JTI of a refresh token that must no longer be accepted (see
+    users/revocation.py). Rows are purged once the token has expired anyway.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at})"
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class LeadCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the admin leads list, newest first. The cursor
+    holds the (created_at, id) of the row it continues from and pages are
+    located with a row comparison on both, so deep pages cost the same as
+    the first one and leads created in the same instant are neither skipped
+    nor repeated.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    steps over rows sharing it with an offset, which can skip rows when
+    paging back across ties; the lookup is reimplemented here for the two
+    columns.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.LEADS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.LEADS_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        if self.cursor is not None:
+            created_at, pk = self.parse_position(self.cursor.position)
+            if reverse:
+                # Walking back towards newer leads
+                boundary = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            else:
+                boundary = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            queryset = queryset.filter(boundary)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.format_position(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.format_position(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def format_position(self, lead):
+        return f'{lead.created_at.isoformat()}|{lead.pk}'
+
+    def parse_position(self, position):
+        """Return (created_at, id) from a cursor position"""
+        try:
+            created_at, _, pk = position.rpartition('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
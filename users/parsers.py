@@ -0,0 +1,31 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON. request.data is a generator yielding one decoded
+    value per non-blank line, so large uploads are read incrementally; a line
+    that isn't valid JSON yields a ParseError in its place rather than failing
+    the whole request.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+
+        def rows():
+            if stream is None:
+                return
+            for number, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line.decode(encoding))
+                except ValueError as exc:
+                    yield ParseError(f'Line {number}: JSON parse error - {exc}')
+
+        return rows()
@@ -0,0 +1,81 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer, ABC):
+    """
+    Renders a list of flat dicts, one line per dict. Export views stream the
+    rows themselves through stream(); render() covers ordinary responses.
+    Subclasses format the lines through format_header() and format_row().
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return ''.join(self.stream(rows, fields)).encode(self.charset)
+
+    def stream(self, rows, fields, chunk_size=1000):
+        """Yield the rendered rows (dicts keyed by fields) in chunks of chunk_size lines"""
+        header = self.format_header(fields)
+        if header:
+            yield header
+        chunk = []
+        for row in rows:
+            chunk.append(self.format_row(row, fields))
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    def format_header(self, fields):
+        """Line written before the rows, if any"""
+        return ''
+
+    @abstractmethod
+    def format_row(self, row, fields):
+        """The line for one row, with its line ending"""
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def format_header(self, fields):
+        return self.writer.writerow(fields)
+
+    def format_row(self, row, fields):
+        return self.writer.writerow([self.format_value(row.get(field)) for field in fields])
+
+    def format_value(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, cls=DjangoJSONEncoder)
+        return value
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def format_row(self, row, fields):
+        return json.dumps({field: row.get(field) for field in fields}, cls=DjangoJSONEncoder) + '\n'
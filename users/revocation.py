@@ -0,0 +1,155 @@
+"""
+Revoked refresh tokens.
+
+RevokedToken rows are the source of truth. Each process also keeps a Bloom
+filter of the revoked JTIs. A token that was never revoked, which is nearly
+every refresh, is therefore accepted without a query. Only a filter hit is
+confirmed against the table.
+
+Revoking bumps the shared 'revoked_tokens' version stamp. A process that
+sees a new stamp adds just the rows created since its last sync to its
+filter. Rows are purged once their token would have expired anyway, and the
+filter is rebuilt from the remaining rows every
+REVOKED_TOKEN_REBUILD_INTERVAL seconds so purged JTIs drop out of it.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import bump_version, get_shared_cache, get_version
+from .models import RevokedToken
+
+# Rows are synced by created_at; the overlap covers transactions that
+# commit a little after the row's timestamp was taken
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """
+        Add item; count only goes up when a bit was unset, so items added
+        again (e.g. by the sync overlap) don't count twice
+        """
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationStore:
+    """Process-local view of the RevokedToken table"""
+
+    def __init__(self, capacity, rebuild_interval):
+        self.capacity = capacity
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._filter = None
+        self._version = None
+        self._synced_at = None
+        self._built_at = None
+
+    def _rebuild(self, version):
+        now = timezone.now()
+        jtis = list(
+            RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True)
+        )
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)))
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter = bloom
+        self._version = version
+        self._synced_at = now
+        self._built_at = time.monotonic()
+
+    def sync(self):
+        """Bring the filter up to date with the table"""
+        version = get_version('revoked_tokens')
+        with self._lock:
+            if (
+                self._filter is None
+                or time.monotonic() - self._built_at > self.rebuild_interval
+                or self._filter.count > self._filter.capacity
+            ):
+                self._rebuild(version)
+                return
+            if version == self._version:
+                return
+
+            now = timezone.now()
+            new_jtis = RevokedToken.objects.filter(
+                created_at__gte=self._synced_at - SYNC_OVERLAP
+            ).values_list('jti', flat=True)
+            for jti in new_jtis:
+                self._filter.add(jti)
+            self._version = version
+            self._synced_at = now
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """
+        Record jti as revoked. Returns False if it already was, e.g. because a
+        concurrent request rotated the same refresh token first.
+        """
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        transaction.on_commit(lambda: bump_version('revoked_tokens'))
+
+        # At most one worker purges per interval
+        if get_shared_cache().add('revoked_tokens:purge', True, settings.REVOKED_TOKEN_PURGE_INTERVAL):
+            purge_expired()
+        return True
+
+
+def purge_expired():
+    """Delete revocations of tokens that have expired; returns how many"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+store = RevocationStore(
+    settings.REVOKED_TOKEN_BLOOM_CAPACITY,
+    settings.REVOKED_TOKEN_REBUILD_INTERVAL,
+)
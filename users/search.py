@@ -0,0 +1,123 @@
+"""
+Full-text search over leads backed by an SQLite FTS5 table.
+
+The index holds one row per lead (rowid = lead id) with the lead's name,
+email, phone, source page and the text of its notes. It uses the trigram
+tokenizer so that matches keep the substring semantics of the icontains
+filters they replace. Terms shorter than three characters, and databases
+other than SQLite, fall back to those icontains filters.
+
+The functions here write the index with raw SQL; searches join it through
+the read-only LeadSearchEntry model.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+
+FTS_TABLE = 'users_lead_search'
+MIN_TERM_LENGTH = 3
+
+
+def fts_enabled():
+    return settings.LEAD_SEARCH_FTS and connection.vendor == 'sqlite'
+
+
+def rebuild_index():
+    """Repopulate the whole index from the lead and note tables"""
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        cursor.execute(
+            """
+            INSERT INTO {fts} (rowid, name, email, phone, source_page, notes)
+            SELECT lead.id, lead.name, lead.email, COALESCE(lead.phone, ''),
+                   COALESCE(lead.source_page, ''),
+                   COALESCE((SELECT GROUP_CONCAT(note.note, ' ')
+                             FROM users_leadnote note WHERE note.lead_id = lead.id), '')
+            FROM users_lead lead
+            """.format(fts=FTS_TABLE)
+        )
+        cursor.execute('SELECT COUNT(*) FROM %s' % FTS_TABLE)
+        return cursor.fetchone()[0]
+
+
+def index_lead(lead):
+    """Insert or refresh the lead's own columns in the index"""
+    values = [lead.name, lead.email, lead.phone or '', lead.source_page or '']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE %s SET name = %%s, email = %%s, phone = %%s, source_page = %%s WHERE rowid = %%s'
+            % FTS_TABLE,
+            values + [lead.pk],
+        )
+        if not cursor.rowcount:
+            cursor.execute(
+                "INSERT INTO %s (rowid, name, email, phone, source_page, notes) "
+                "VALUES (%%s, %%s, %%s, %%s, %%s, '')" % FTS_TABLE,
+                [lead.pk] + values,
+            )
+
+
+def index_new_leads(leads):
+    """Add freshly created leads (which have no notes yet) to the index"""
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO %s (rowid, name, email, phone, source_page, notes) "
+            "VALUES (%%s, %%s, %%s, %%s, %%s, '')" % FTS_TABLE,
+            [(lead.pk, lead.name, lead.email, lead.phone or '', lead.source_page or '')
+             for lead in leads],
+        )
+
+
+def index_lead_notes(lead_id):
+    """Refresh the notes column of a lead from its LeadNote rows"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE {fts} SET notes = COALESCE(
+                (SELECT GROUP_CONCAT(note, ' ') FROM users_leadnote WHERE lead_id = %s), '')
+            WHERE rowid = %s
+            """.format(fts=FTS_TABLE),
+            [lead_id, lead_id],
+        )
+
+
+def remove_lead(lead_id):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [lead_id])
+
+
+def _phrase(term):
+    return '"%s"' % term.replace('"', '""')
+
+
+def search_leads(queryset, search=None, source_page=None):
+    """
+    Restrict a Lead queryset to leads matching search (any indexed column)
+    and source_page. When search is given the results are ordered by
+    relevance, best first.
+    """
+    terms = [term for term in (search, source_page) if term]
+    if not terms:
+        return queryset
+
+    if not fts_enabled() or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        if search:
+            queryset = queryset.filter(
+                Q(name__icontains=search) |
+                Q(email__icontains=search) |
+                Q(phone__icontains=search)
+            )
+        if source_page:
+            queryset = queryset.filter(source_page__icontains=source_page)
+        return queryset
+
+    expression = []
+    if search:
+        expression.append(_phrase(search))
+    if source_page:
+        expression.append('source_page : %s' % _phrase(source_page))
+
+    queryset = queryset.filter(search_entry__document__match=' AND '.join(expression))
+    if search:
+        queryset = queryset.annotate(search_rank=F('search_entry__rank')).order_by('search_rank', '-created_at')
+    return queryset
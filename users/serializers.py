@@ -1,12 +1,36 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenObtainSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
 from .models import CustomUser, Property, Collaboration, Slide, YourPerfect, SidebarCard, Damac, EmpoweringCommunities, CMSSettings, Lead, LeadNote, Hero, Deal
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.translation import gettext_lazy as _
+from . import revocation
+from .authentication import get_cached_user
+
+
+def variant_urls(variants):
+    """
+    {format: {width: url}} for an image's <field>_variants (see
+    users/images.py), for building srcset; None until they are generated
+    """
+    if not variants:
+        return None
+    return {
+        key: {width: f"{settings.BACKEND_URL}{default_storage.url(name)}" for width, name in variants[key].items()}
+        for key in ('webp', 'jpeg')
+        if key in variants
+    }
+
 
 class PropertySerializer(serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     class Meta:
         model = Property
-        fields = '__all__'
+        exclude = ['img_variants']
 
     def get_img_url(self, obj):
         if obj.img:
@@ -14,13 +38,18 @@ class PropertySerializer(serializers.ModelSerializer):
         else:
             return None
 
+    def get_img_srcset(self, obj):
+        return variant_urls(obj.img_variants) if obj.img else None
+
 
 class CollaborationSerializer(serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     logo_url = serializers.SerializerMethodField()
+    logo_srcset = serializers.SerializerMethodField()
     class Meta:
         model = Collaboration
-        fields = '__all__'
+        exclude = ['img_variants', 'logo_variants']
 
     def get_img_url(self, obj):
         if obj.img:
@@ -32,45 +61,62 @@ class CollaborationSerializer(serializers.ModelSerializer):
             return f"{settings.BACKEND_URL}{obj.logo.url}"
         return None
 
+    def get_img_srcset(self, obj):
+        return variant_urls(obj.img_variants) if obj.img else None
+
+    def get_logo_srcset(self, obj):
+        return variant_urls(obj.logo_variants) if obj.logo else None
+
 
 
 
 class SlideSerializer(serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     class Meta:
         model = Slide
-        fields = '__all__'
+        exclude = ['img_variants']
     def get_img_url(self, obj):
         if obj.img:
             return f"{settings.BACKEND_URL}{obj.img.url}"
         return None
+    def get_img_srcset(self, obj):
+        return variant_urls(obj.img_variants) if obj.img else None
 
 
 
 class YourPerfectSerializer(serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     class Meta:
         model = YourPerfect
-        fields = '__all__'
+        exclude = ['img_variants']
 
     def get_img_url(self, obj):
         if obj.img:
             return f"{settings.BACKEND_URL}{obj.img.url}"
         return None
 
+    def get_img_srcset(self, obj):
+        return variant_urls(obj.img_variants) if obj.img else None
+
 
 
 class SidebarCardSerializer(serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
+    img_srcset = serializers.SerializerMethodField()
     class Meta:
         model = SidebarCard
-        fields = '__all__'
+        exclude = ['img_variants']
 
     def get_img_url(self, obj):
         if obj.img:
             return f"{settings.BACKEND_URL}{obj.img.url}"
         return None
 
+    def get_img_srcset(self, obj):
+        return variant_urls(obj.img_variants) if obj.img else None
+
 
 class DamacSerializer(serializers.ModelSerializer):
     class Meta:
@@ -90,6 +136,67 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 
+class PreauthenticatedTokenObtainSerializer(TokenObtainSerializer):
+    """
+    TokenObtainSerializer for a user the view has already authenticated,
+    passed as context['user'] (None for wrong credentials), instead of
+    calling the blocking authenticate()
+    """
+
+    def validate(self, attrs):
+        self.user = self.context.get('user')
+        if not jwt_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        return {}
+
+
+class AsyncTokenObtainPairSerializer(TokenObtainPairSerializer, PreauthenticatedTokenObtainSerializer):
+    """
+    TokenObtainPairSerializer for AsyncTokenObtainPairView, which checks the
+    credentials with aauthenticate(). Its validate() still issues the pair
+    (and applies UPDATE_LAST_LOGIN); the super() call it makes lands on
+    PreauthenticatedTokenObtainSerializer.
+    """
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer that revokes rotated refresh tokens through
+    users/revocation.py and reads the user's active flag from the JWT user
+    cache, so a refresh normally runs no SELECT at all
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        jti = refresh[jwt_settings.JTI_CLAIM]
+        if revocation.store.is_revoked(jti):
+            raise TokenError(_("Token is blacklisted"))
+
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM, None)
+        if user_id and not jwt_settings.USER_AUTHENTICATION_RULE(get_cached_user(user_id)):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"],
+                "no_active_account",
+            )
+
+        data = {"access": str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                # Losing the race against a concurrent refresh of the same
+                # token counts as reusing a revoked one
+                if not revocation.store.revoke(jti, datetime_from_epoch(refresh["exp"])):
+                    raise TokenError(_("Token is blacklisted"))
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     
@@ -131,12 +238,13 @@ class CMSSettingsSerializer(serializers.ModelSerializer):
 class AgentSerializer(serializers.ModelSerializer):
     """Serializer for Agent model (CustomUser with agent role)"""
     photo_url = serializers.SerializerMethodField()
+    photo_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = CustomUser
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name', 'role',
-            'photo', 'photo_url', 'title', 'phone', 'bio', 'status', 'profile_visible'
+            'photo', 'photo_url', 'photo_srcset', 'title', 'phone', 'bio', 'status', 'profile_visible'
         ]
         extra_kwargs = {
             'password': {'write_only': True, 'required': False},
@@ -150,6 +258,10 @@ class AgentSerializer(serializers.ModelSerializer):
             return f"{settings.BACKEND_URL}{obj.photo.url}"
         return None
     
+    def get_photo_srcset(self, obj):
+        """Get resized photo URLs by format and width"""
+        return variant_urls(obj.photo_variants) if obj.photo else None
+    
     def validate_role(self, value):
         """Ensure role is always 'agent' for this serializer"""
         if value != 'agent':
@@ -191,11 +303,28 @@ class LeadNoteSerializer(serializers.ModelSerializer):
         return None
 
 
+def legacy_internal_notes(lead):
+    """
+    The lead's recent notes in the shape of the retired internal_notes blob,
+    {timestamp: {'note', 'author', 'timestamp'}}, for clients that still
+    read it
+    """
+    notes = {}
+    for note in lead.recent_notes:
+        timestamp = note.created_at.isoformat()
+        author = note.user.username if note.user else 'System'
+        notes[timestamp] = {'note': note.note, 'author': author, 'timestamp': timestamp}
+    return notes
+
+
 class LeadSerializer(serializers.ModelSerializer):
     """Serializer for Lead model (admin full access)"""
     assigned_agent_name = serializers.SerializerMethodField()
     assigned_agent_email = serializers.SerializerMethodField()
-    notes_history = LeadNoteSerializer(source='notes', many=True, read_only=True)
+    notes_history = LeadNoteSerializer(source='recent_notes', many=True, read_only=True)
+    # Read-only since notes moved to LeadNote rows; write notes through
+    # activity_note instead
+    internal_notes = serializers.SerializerMethodField()
     
     class Meta:
         model = Lead
@@ -212,6 +341,10 @@ class LeadSerializer(serializers.ModelSerializer):
             return obj.assigned_agent.get_full_name() or obj.assigned_agent.username
         return None
     
+    def get_internal_notes(self, obj):
+        """Recent notes in the legacy internal_notes shape"""
+        return legacy_internal_notes(obj)
+    
     def get_assigned_agent_email(self, obj):
         """Get assigned agent email"""
         if obj.assigned_agent:
@@ -228,7 +361,10 @@ class LeadSerializer(serializers.ModelSerializer):
 class AgentLeadSerializer(serializers.ModelSerializer):
     """Serializer for Lead model (agent restricted access)"""
     assigned_agent_name = serializers.SerializerMethodField()
-    notes_history = LeadNoteSerializer(source='notes', many=True, read_only=True)
+    notes_history = LeadNoteSerializer(source='recent_notes', many=True, read_only=True)
+    # Read-only since notes moved to LeadNote rows; write notes through
+    # activity_note instead
+    internal_notes = serializers.SerializerMethodField()
     
     class Meta:
         model = Lead
@@ -245,6 +381,10 @@ class AgentLeadSerializer(serializers.ModelSerializer):
             return obj.assigned_agent.get_full_name() or obj.assigned_agent.username
         return None
     
+    def get_internal_notes(self, obj):
+        """Recent notes in the legacy internal_notes shape"""
+        return legacy_internal_notes(obj)
+    
     def validate_status(self, value):
         """Validate status transitions for agents"""
         # Get current status if updating
@@ -267,12 +407,13 @@ class AgentLeadSerializer(serializers.ModelSerializer):
 class HeroSerializer(serializers.ModelSerializer):
     """Serializer for Hero model (admin full access)"""
     media_url = serializers.SerializerMethodField()
+    media_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Hero
         fields = [
             'id', 'type', 'heading', 'subheading', 'cta_text', 'cta_link',
-            'media', 'media_url', 'video', 'is_active', 'created_at', 'updated_at'
+            'media', 'media_url', 'media_srcset', 'video', 'is_active', 'created_at', 'updated_at'
         ]
     
     def get_media_url(self, obj):
@@ -281,19 +422,24 @@ class HeroSerializer(serializers.ModelSerializer):
             from django.conf import settings
             return f"{settings.BACKEND_URL}{obj.media.url}"
         return None
+    
+    def get_media_srcset(self, obj):
+        """Get resized media URLs by format and width"""
+        return variant_urls(obj.media_variants) if obj.media else None
 
 
 class PublicHeroSerializer(serializers.ModelSerializer):
     """Serializer for Hero model (public read-only)"""
     media_url = serializers.SerializerMethodField()
+    media_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Hero
         fields = [
             'type', 'heading', 'subheading', 'cta_text', 'cta_link',
-            'media_url', 'video'
+            'media_url', 'media_srcset', 'video'
         ]
-        read_only_fields = ['type', 'heading', 'subheading', 'cta_text', 'cta_link', 'media_url', 'video']
+        read_only_fields = ['type', 'heading', 'subheading', 'cta_text', 'cta_link', 'media_url', 'media_srcset', 'video']
     
     def get_media_url(self, obj):
         """Get full media URL"""
@@ -301,6 +447,10 @@ class PublicHeroSerializer(serializers.ModelSerializer):
             from django.conf import settings
             return f"{settings.BACKEND_URL}{obj.media.url}"
         return None
+    
+    def get_media_srcset(self, obj):
+        """Get resized media URLs by format and width"""
+        return variant_urls(obj.media_variants) if obj.media else None
 
 
 class PublicLeadSerializer(serializers.ModelSerializer):
@@ -418,10 +568,11 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False, allow_blank=True)
     profile_image = serializers.ImageField(source='photo', required=False, allow_null=True)
     profile_image_url = serializers.SerializerMethodField()
+    profile_image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = CustomUser
-        fields = ['id', 'email', 'title', 'phone', 'bio', 'profile_image', 'profile_image_url', 'password']
+        fields = ['id', 'email', 'title', 'phone', 'bio', 'profile_image', 'profile_image_url', 'profile_image_srcset', 'password']
         read_only_fields = ['id', 'email']
         extra_kwargs = {
             'password': {'write_only': True, 'required': False},
@@ -437,6 +588,10 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
             return f"{settings.BACKEND_URL}{obj.photo.url}"
         return None
     
+    def get_profile_image_srcset(self, obj):
+        """Get resized profile image URLs by format and width"""
+        return variant_urls(obj.photo_variants) if obj.photo else None
+    
     def validate_password(self, value):
         """Validate password - ignore if empty string"""
         if value == '':
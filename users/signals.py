@@ -0,0 +1,161 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import dedup, images, search
+from .assignment import AGENT_FIELDS, engine as assignment_engine
+from .authentication import invalidate_cached_user
+from .cache import bump_version
+from .models import (
+    CMSSettings, Collaboration, CustomUser, Damac, EmpoweringCommunities, Hero,
+    Lead, LeadDailyStat, LeadNote, Property, SidebarCard, Slide, YourPerfect
+)
+
+# Models rendered by the public homepage payload (see PublicHomeView)
+HOME_CONTENT_MODELS = [
+    CMSSettings, Property, Slide, YourPerfect, Collaboration,
+    SidebarCard, Damac, EmpoweringCommunities, Hero,
+]
+
+# CustomUser fields rendered or filtered on by the homepage agents section;
+# saves of other fields alone (last_login on every login, a rehashed
+# password) leave the payload as it is
+HOME_AGENT_FIELDS = {
+    'username', 'email', 'first_name', 'last_name', 'role', 'photo', 'photo_variants',
+    'title', 'phone', 'bio', 'status', 'profile_visible',
+}
+
+
+@receiver(post_save, sender=Lead)
+def update_lead_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Move the lead's count to its new rollup row, and to its agent's open-lead
+    count for assignment once the save is committed, when its key changes
+    """
+    if raw:
+        return
+
+    new_key = instance.stats_key()
+    old_key = None if created else getattr(instance, '_loaded_stats_key', None)
+
+    if not created and old_key is None:
+        # Instance was not loaded with its key fields; rebuild_lead_stats
+        # will reconcile any drift
+        instance._loaded_stats_key = new_key
+        return
+
+    if old_key != new_key:
+        if old_key is not None:
+            LeadDailyStat.adjust(old_key, -1)
+        LeadDailyStat.adjust(new_key, 1)
+        transaction.on_commit(partial(assignment_engine.lead_changed, old_key, new_key))
+    instance._loaded_stats_key = new_key
+
+
+@receiver(post_delete, sender=Lead)
+def update_lead_stats_on_delete(sender, instance, **kwargs):
+    """Remove a deleted lead from the rollup"""
+    key = getattr(instance, '_loaded_stats_key', None)
+    if key is None and instance.created_at is not None:
+        key = instance.stats_key()
+    if key is not None:
+        LeadDailyStat.adjust(key, -1)
+        transaction.on_commit(partial(assignment_engine.lead_changed, key, None))
+
+
+@receiver(pre_delete, sender=CustomUser)
+def unassign_lead_stats(sender, instance, **kwargs):
+    """Move a deleted agent's rollup rows to the unassigned ones, as SET_NULL does with the leads"""
+    LeadDailyStat.unassign(instance.pk)
+
+
+@receiver(post_save, sender=Lead)
+def update_lead_search_on_save(sender, instance, raw=False, **kwargs):
+    """Keep the full-text search row of a lead current"""
+    if not raw and search.fts_enabled():
+        search.index_lead(instance)
+
+
+@receiver(post_delete, sender=Lead)
+def update_lead_search_on_delete(sender, instance, **kwargs):
+    if search.fts_enabled():
+        search.remove_lead(instance.pk)
+
+
+@receiver(post_delete, sender=Lead)
+def forget_lead_fingerprint(sender, instance, **kwargs):
+    """Stop answering duplicate submissions with a deleted lead (this process only)"""
+    if instance.fingerprint:
+        dedup.recent.discard(instance.fingerprint)
+
+
+@receiver(post_save, sender=LeadNote)
+@receiver(post_delete, sender=LeadNote)
+def update_lead_search_notes(sender, instance, raw=False, **kwargs):
+    """Re-index the notes text of the lead a note belongs to"""
+    if not raw and search.fts_enabled():
+        search.index_lead_notes(instance.lead_id)
+
+
+@receiver(post_save, sender=CMSSettings)
+@receiver(post_delete, sender=CMSSettings)
+def invalidate_cms_settings_cache(sender, **kwargs):
+    """Make every worker reload CMS settings once the write is committed"""
+    transaction.on_commit(CMSSettings.clear_cached_settings)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_jwt_user(sender, instance, **kwargs):
+    """Make every worker reload the user's role and flags once the write is committed"""
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_lead_assignment(sender, instance, update_fields=None, **kwargs):
+    """Make every worker reload the assignable agents once the write is committed"""
+    if update_fields is not None and not AGENT_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(assignment_engine.invalidate)
+
+
+def invalidate_public_home_cache(sender, **kwargs):
+    """Make every worker rebuild the homepage payload once the write is committed"""
+    transaction.on_commit(lambda: bump_version('public_home'))
+
+
+for model in HOME_CONTENT_MODELS:
+    post_save.connect(invalidate_public_home_cache, sender=model)
+    post_delete.connect(invalidate_public_home_cache, sender=model)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_public_home_agents(sender, update_fields=None, **kwargs):
+    """Rebuild the homepage payload when an agent's public profile may have changed"""
+    if update_fields is not None and not HOME_AGENT_FIELDS.intersection(update_fields):
+        return
+    invalidate_public_home_cache(sender, **kwargs)
+
+
+def generate_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Render resized variants of a new or replaced upload once it is committed"""
+    if raw:
+        return
+    deferred = instance.get_deferred_fields()
+    for model, field_name in images.image_fields(sender):
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        if field_name in deferred:
+            continue
+        if images.needs_variants(instance, field_name):
+            name = getattr(instance, field_name).name
+            transaction.on_commit(partial(images.schedule, model, instance.pk, field_name, name))
+
+
+for model in {model for model, _ in images.image_fields()}:
+    post_save.connect(generate_image_variants, sender=model)
@@ -1,3 +1,1400 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.contrib.auth.models import update_last_login
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import assignment, dedup, hashing, images, ingest, lead_queue, revocation, search, views
+from .authentication import EmailBackend
+from .cache import get_version
+from .models import (
+    CMSSettings, CustomUser, Deal, Lead, LeadDailyStat, LeadNote, Property, RevokedToken, Slide,
+    lead_fingerprint, normalize_email, normalize_phone
+)
+from .renderers import CSVRenderer, NDJSONRenderer, StreamingRenderer
+from .serializers import PropertySerializer
+from .views import AsyncLoginView, AsyncTokenObtainPairView
+
+# The shared cache defaults to a FileBasedCache under BASE_DIR, which would
+# carry entries from one test run into the next
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in ('default', 'shared')
+}
+
+
+class EmptyCachesMixin:
+    """Start every test with empty in-memory caches"""
+
+    def setUp(self):
+        super().setUp()
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CacheTestCase(EmptyCachesMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CacheTransactionTestCase(EmptyCachesMixin, TransactionTestCase):
+    pass
+
+
+def create_agents(count, prefix='agent'):
+    """Bulk create agent users for query-count tests"""
+    return CustomUser.objects.bulk_create([
+        CustomUser(
+            username=f'{prefix}{i}',
+            email=f'{prefix}{i}@test.com',
+            first_name='Agent',
+            last_name=str(i),
+            role='agent',
+        )
+        for i in range(count)
+    ])
+
+
+def create_leads(count, agents, prefix='lead'):
+    """Bulk create leads spread across agents, statuses and traffic sources"""
+    statuses = [choice for choice, _ in Lead.STATUS_CHOICES]
+    sources = ['organic', 'google', 'facebook', 'instagram']
+    leads = Lead.objects.bulk_create([
+        Lead(
+            name=f'{prefix} {i}',
+            email=f'{prefix}{i}@example.com',
+            phone=f'050{i:07d}',
+            traffic_source=sources[i % len(sources)],
+            status=statuses[i % len(statuses)],
+            assigned_agent=agents[i % len(agents)] if i % 7 else None,
+        )
+        for i in range(count)
+    ])
+    # bulk_create skips the signal handlers that maintain the rollup
+    LeadDailyStat.rebuild()
+    return leads
+
+
+class AdminAnalyticsQueryCountTests(CacheTestCase):
+    """The admin analytics payload must cost a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(
+            username='admin', email='admin@test.com', password='admin123', role='admin'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_analytics(self, **params):
+        return self.client.get('/api/analytics/', params)
+
+    def test_query_count_independent_of_dataset_size(self):
+        agents = create_agents(3, prefix='small')
+        create_leads(20, agents, prefix='small')
+        with self.assertNumQueries(5):
+            self.assertEqual(self.get_analytics().status_code, 200)
+
+        agents += create_agents(200)
+        create_leads(5000, agents)
+        with self.assertNumQueries(5):
+            response = self.get_analytics()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['agent_performance']), 203)
+
+        with self.assertNumQueries(5):
+            self.get_analytics(date_from='2000-01-01', date_to='2100-01-01', agent_id=agents[0].id)
+
+    def test_payload_matches_per_agent_counts(self):
+        agents = create_agents(5)
+        idle_agent = create_agents(1, prefix='idle')[0]
+        create_leads(140, agents)
+
+        data = self.get_analytics().data
+        overview = data['overview']
+        self.assertEqual(overview['total_leads'], Lead.objects.count())
+        self.assertEqual(overview['converted_leads'], Lead.objects.filter(status='converted').count())
+        self.assertEqual(overview['closed_lost_leads'], Lead.objects.filter(status='closed_lost').count())
+        self.assertEqual(
+            {row['status']: row['count'] for row in data['status_breakdown']},
+            {status: Lead.objects.filter(status=status).count() for status, _ in Lead.STATUS_CHOICES},
+        )
+
+        performance = {row['agent_id']: row for row in data['agent_performance']}
+        for agent in agents:
+            self.assertEqual(performance[agent.id]['total_leads'], agent.assigned_leads.count())
+            self.assertEqual(
+                performance[agent.id]['converted_leads'],
+                agent.assigned_leads.filter(status='converted').count(),
+            )
+            self.assertEqual(performance[agent.id]['agent_name'], agent.get_full_name())
+        self.assertEqual(performance[idle_agent.id]['total_leads'], 0)
+        self.assertEqual(performance[idle_agent.id]['conversion_rate'], 0)
+
+
+class AgentAnalyticsQueryCountTests(CacheTestCase):
+    """The agent analytics payload must cost a fixed number of queries"""
+
+    def setUp(self):
+        super().setUp()
+        self.agent, self.other_agent = create_agents(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def test_query_count_independent_of_dataset_size(self):
+        create_leads(20, [self.agent])
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/agent/analytics/').status_code, 200)
+
+        create_leads(2000, [self.agent, self.other_agent], prefix='more')
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/agent/analytics/', {'date_from': '2000-01-01', 'date_to': '2100-01-01'}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_payload_matches_lead_counts(self):
+        create_leads(140, [self.agent, self.other_agent])
+        leads = self.agent.assigned_leads.all()
+
+        data = self.client.get('/api/agent/analytics/').data
+        overview = data['overview']
+        self.assertEqual(overview['total_leads'], leads.count())
+        for status, _ in Lead.STATUS_CHOICES:
+            self.assertEqual(overview[f'{status}_leads'], leads.filter(status=status).count())
+        self.assertEqual(
+            overview['conversion_rate'],
+            round(leads.filter(status='converted').count() / leads.count() * 100, 2),
+        )
+        self.assertEqual(
+            {row['status']: row['count'] for row in data['status_breakdown']},
+            {status: leads.filter(status=status).count() for status, _ in Lead.STATUS_CHOICES},
+        )
+        self.assertEqual(len(data['recent_activity']), 5)
+        self.assertLessEqual({row['id'] for row in data['recent_activity']}, set(leads.values_list('id', flat=True)))
+
+        empty = self.client.get('/api/agent/analytics/', {'date_to': '2000-01-01'}).data['overview']
+        self.assertEqual((empty['total_leads'], empty['conversion_rate']), (0, 0))
+
+
+class AgentRevenueTests(CacheTestCase):
+    url = '/api/agent/revenue/'
+
+    def setUp(self):
+        super().setUp()
+        self.agent, other_agent = create_agents(2)
+        this_month = timezone.localdate().replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        self.month_keys = [last_month.strftime('%Y-%m'), this_month.strftime('%Y-%m')]
+        deals = [
+            (self.agent, this_month, '1000.00', '2.00'),
+            (self.agent, this_month, '500.00', None),
+            (self.agent, last_month, '2000.00', '1.00'),
+            (self.agent, this_month.replace(year=this_month.year - 20), '7000.00', None),
+            (other_agent, this_month, '9999.00', '5.00'),
+        ]
+        for i, (agent, closed_date, revenue, rate) in enumerate(deals):
+            lead = Lead.objects.create(
+                name=f'Buyer {i}', email=f'buyer{i}@example.com', status='converted', assigned_agent=agent
+            )
+            Deal.objects.create(
+                lead=lead, closed_date=closed_date, revenue_amount=Decimal(revenue),
+                commission_rate=rate and Decimal(rate)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def test_totals_and_monthly_series(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {'months': 2}).data
+        self.assertEqual(Decimal(data['total_revenue']), Decimal('10500.00'))
+        self.assertEqual(Decimal(data['total_commission']), Decimal('40.00'))
+        self.assertEqual(data['converted_leads_count'], 4)
+        self.assertEqual(
+            [
+                (row['month'], Decimal(row['revenue']), Decimal(row['commission']), row['deals_count'])
+                for row in data['revenue_by_month']
+            ],
+            [
+                (self.month_keys[0], Decimal('2000.00'), Decimal('20.00'), 1),
+                (self.month_keys[1], Decimal('1500.00'), Decimal('20.00'), 2),
+            ]
+        )
+        self.assertEqual(len(data['recent_deals']), 4)
+
+    def test_months_bounds(self):
+        for months, expected in (('0', 1), ('-5', 1), ('abc', 12), (None, 12), ('500', 120)):
+            params = {} if months is None else {'months': months}
+            series = self.client.get(self.url, params).data['revenue_by_month']
+            self.assertEqual(len(series), expected)
+            self.assertEqual(series[-1]['month'], self.month_keys[1])
+            self.assertEqual([row['month'] for row in series], sorted({row['month'] for row in series}))
+
+
+class LeadDailyStatTests(CacheTestCase):
+    """The rollup must follow lead creation, status changes and reassignment"""
+
+    def rollup(self):
+        return {
+            (row.assigned_agent_id, row.status, row.traffic_source): row.count
+            for row in LeadDailyStat.objects.filter(count__gt=0)
+        }
+
+    def test_rollup_tracks_lead_changes(self):
+        agent, other_agent = create_agents(2)
+        lead = Lead.objects.create(name='Lead', email='lead@example.com', traffic_source='google')
+        self.assertEqual(self.rollup(), {(None, 'new', 'google'): 1})
+
+        lead.assigned_agent = agent
+        lead.status = 'contacted'
+        lead.save()
+        self.assertEqual(self.rollup(), {(agent.id, 'contacted', 'google'): 1})
+
+        lead = Lead.objects.get(pk=lead.pk)
+        lead.assigned_agent = other_agent
+        lead.save()
+        lead.save()
+        self.assertEqual(self.rollup(), {(other_agent.id, 'contacted', 'google'): 1})
+
+        lead.delete()
+        self.assertEqual(self.rollup(), {})
+
+    def test_rebuild_matches_incremental_counts(self):
+        agents = create_agents(3)
+        for i in range(12):
+            lead = Lead.objects.create(name=f'Lead {i}', email=f'lead{i}@example.com', traffic_source='organic')
+            lead.assigned_agent = agents[i % 3]
+            lead.status = 'contacted' if i % 2 else 'new'
+            lead.save()
+        incremental = self.rollup()
+        LeadDailyStat.rebuild()
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_one_row_per_key(self):
+        day = timezone.localdate()
+        LeadDailyStat.objects.create(day=day, status='new', traffic_source=None, count=1)
+        LeadDailyStat.objects.create(day=day, status='new', traffic_source='', count=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LeadDailyStat.objects.create(day=day, status='new', traffic_source=None, count=1)
+
+        # A concurrent first write created the row between update() and create()
+        update = QuerySet.update
+        misses = []
+
+        def update_missing_once(queryset, **kwargs):
+            if not misses:
+                misses.append(True)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_missing_once):
+            LeadDailyStat.adjust((day, None, 'new', None), 2)
+        self.assertEqual(self.rollup(), {(None, 'new', None): 3, (None, 'new', ''): 1})
+
+    def test_deleting_an_agent_merges_into_unassigned(self):
+        agent = create_agents(1)[0]
+        Lead.objects.create(name='Unassigned', email='u@example.com', traffic_source='google')
+        Lead.objects.create(name='Assigned', email='a@example.com', traffic_source='google', assigned_agent=agent)
+        agent.delete()
+        self.assertEqual(self.rollup(), {(None, 'new', 'google'): 2})
+
+
+class CMSSettingsCacheTests(CacheTransactionTestCase):
+    """Runs under autocommit, where on_commit hooks fire as soon as the row is written"""
+
+    def test_first_load_creates_the_row(self):
+        CMSSettings.clear_cached_settings()
+        result = []
+
+        def load():
+            try:
+                result.append(CMSSettings.get_cached_settings())
+            finally:
+                connection.close()
+
+        # Creating the row invalidates the cache from inside its own loader
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), 'get_cached_settings() hung on an empty table')
+        self.assertEqual(result[0].pk, CMSSettings.objects.get().pk)
+
+
+class PublicHomeTests(CacheTestCase):
+    url = '/api/public/home/'
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            CMSSettings.get_settings()
+            self.agent = CustomUser.objects.create_user(
+                username='home-agent', email='home-agent@test.com', password='x', role='agent'
+            )
+            Property.objects.create(title='Villa', location='Palm', price='1M')
+        views._public_home_cache.invalidate()
+        # Read the version stamp on every request rather than every few seconds
+        patcher = mock.patch.object(views._public_home_cache, 'check_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def get_home(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_sections(self):
+        data = self.get_home().data
+        self.assertEqual(set(data), {
+            'settings', 'hero', 'agents', 'properties', 'slides', 'yourperfect',
+            'collaborations', 'sidebarcard', 'damac', 'empoweringcommunities',
+        })
+        self.assertEqual([agent['id'] for agent in data['agents']], [self.agent.id])
+        self.assertEqual([item['title'] for item in data['properties']], ['Villa'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CMSSettings.objects.update(marketingSection=False)
+            CMSSettings.get_settings().save()
+        self.assertNotIn('collaborations', self.get_home().data)
+
+    def test_content_edits_invalidate_but_logins_do_not(self):
+        etag = self.get_home()['ETag']
+        version = get_version('public_home')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, self.agent)
+            self.agent.set_password('rehashed')
+            self.agent.save(update_fields=['password'])
+        self.assertEqual(get_version('public_home'), version)
+        not_modified = self.get_home(if_none_match=etag)
+        self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, etag))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.title = 'Senior Agent'
+            self.agent.save(update_fields=['title'])
+        response = self.get_home(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['agents'][0]['title'], 'Senior Agent')
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.create(title='Penthouse', location='Marina', price='2M')
+        response = self.get_home(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['properties']), 2)
+
+
+class ConditionalGetTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(title='Villa', location='Palm', price='1M')
+        self.client = APIClient()
+
+    def test_list_and_detail(self):
+        for url in ('/api/properties/', f'/api/properties/{self.property.pk}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, headers={'if-none-match': etag})
+            self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+            self.property.price = f'{url} price'
+            self.property.save()
+            response = self.client.get(url, headers={'if-none-match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_or_malformed_pk(self):
+        for pk in (self.property.pk + 1, 'abc'):
+            self.assertEqual(self.client.get(f'/api/properties/{pk}/').status_code, 404)
+
+
+class LeadCursorPaginationTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin = CustomUser.objects.create_user(
+            username='pager', email='pager@test.com', password='x', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        leads = create_leads(9, [admin])
+        # Five leads created in the same instant straddle the page boundaries
+        tied, earlier = timezone.now(), timezone.now() - timedelta(hours=1)
+        Lead.objects.filter(pk__in=[lead.pk for lead in leads[2:7]]).update(created_at=tied)
+        Lead.objects.filter(pk__in=[lead.pk for lead in leads[7:]]).update(created_at=earlier)
+        self.expected = list(Lead.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_next_and_previous_across_tied_timestamps(self):
+        pages = []
+        url = '/api/leads/?page_size=2'
+        while url:
+            data = self.client.get(url).data
+            pages.append([lead['id'] for lead in data['results']])
+            url = data['next']
+        self.assertEqual([lead_id for page in pages for lead_id in page], self.expected)
+        self.assertEqual(len(pages), 5)
+
+        previous_pages = []
+        url = data['previous']
+        while url:
+            data = self.client.get(url).data
+            previous_pages.append([lead['id'] for lead in data['results']])
+            url = data['previous']
+        self.assertEqual(previous_pages, pages[-2::-1])
+
+        self.assertEqual(self.client.get('/api/leads/', {'cursor': 'cD1ub3RhZGF0ZQ=='}).status_code, 404)
+
+
+class LeadSearchTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin = CustomUser.objects.create_user(
+            username='searcher', email='searcher@test.com', password='x', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/leads/', {'search': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def matches(self, term, **kwargs):
+        return list(search.search_leads(Lead.objects.all(), search=term, **kwargs).values_list('name', flat=True))
+
+    def test_matching_and_ranking(self):
+        once = Lead.objects.create(name='Dana Once', email='dana@example.com', source_page='/offplan')
+        LeadNote.objects.create(lead=once, note='Asked about several areas, one of them the marina, and schools')
+        often = Lead.objects.create(name='Marina Towers', email='marina@example.com', source_page='/marina')
+        LeadNote.objects.create(lead=often, note='Marina view, marina berth')
+        Lead.objects.create(name='Unrelated', email='other@example.com', phone='0509998877')
+
+        self.assertEqual([lead['name'] for lead in self.search('marina')['results']], ['Marina Towers', 'Dana Once'])
+        # Substrings match, as with icontains
+        self.assertEqual(self.matches('998877'), ['Unrelated'])
+        self.assertEqual(self.matches('marina', source_page='offplan'), ['Dana Once'])
+        # Terms too short for the trigram index fall back to icontains on
+        # the lead's own columns
+        self.assertEqual(self.matches('ma'), ['Marina Towers'])
+
+    @override_settings(LEAD_SEARCH_LIMIT=2)
+    def test_truncated_results_are_flagged(self):
+        create_leads(3, create_agents(1), prefix='capped')
+        # bulk_create skips the signal that indexes each lead
+        search.rebuild_index()
+        data = self.search('capped')
+        self.assertEqual((len(data['results']), data['truncated']), (2, True))
+        data = self.search('capped 1')
+        self.assertEqual((len(data['results']), data['truncated']), (1, False))
+
+    def test_index_follows_lead_and_note_writes(self):
+        lead = Lead.objects.create(name='Zephyr Quill', email='zq@example.com')
+        self.assertEqual(self.matches('zephyr'), ['Zephyr Quill'])
+
+        lead.name = 'Aurora Quill'
+        lead.save()
+        self.assertEqual((self.matches('zephyr'), self.matches('aurora')), ([], ['Aurora Quill']))
+
+        note = LeadNote.objects.create(lead=lead, note='Prefers a quokka-friendly garden')
+        self.assertEqual(self.matches('quokka'), ['Aurora Quill'])
+        note.delete()
+        self.assertEqual(self.matches('quokka'), [])
+
+        lead.delete()
+        self.assertEqual(self.matches('aurora'), [])
+        search.rebuild_index()
+        self.assertEqual(self.matches('quill'), [])
+
+
+class LeadContactNormalizationTests(CacheTestCase):
+
+    def test_normalize_phone(self):
+        for raw in ('050 123 4567', '+971 50-123-4567', '00971501234567', '(050) 1234567'):
+            self.assertEqual(normalize_phone(raw), '+971501234567', raw)
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), '+442079460958')
+        for raw in (None, '', '  ', 'n/a'):
+            self.assertIsNone(normalize_phone(raw))
+        with self.settings(LEAD_DEFAULT_COUNTRY_CODE='44'):
+            self.assertEqual(normalize_phone('020 7946 0958'), '+442079460958')
+
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email('  Jane.Doe@Example.COM '), 'jane.doe@example.com')
+        for raw in (None, '', '   '):
+            self.assertIsNone(normalize_email(raw))
+
+    def test_save_keeps_lookup_columns_current(self):
+        lead = Lead.objects.create(name='Jane', email=' Jane@Example.com', phone='050 123 4567')
+        self.assertEqual((lead.email_normalized, lead.phone_normalized), ('jane@example.com', '+971501234567'))
+
+        lead.phone = '+44 20 7946 0958'
+        lead.save(update_fields=['phone'])
+        lead.refresh_from_db()
+        self.assertEqual(lead.phone_normalized, '+442079460958')
+
+    def test_backfill_command(self):
+        leads = create_leads(5, create_agents(1))
+        # bulk_create skips save(), which fills the lookup columns
+        self.assertFalse(Lead.objects.filter(phone_normalized__isnull=False).exists())
+
+        stdout = io.StringIO()
+        call_command('backfill_lead_contacts', batch_size=2, stdout=stdout)
+        self.assertIn('on 5 leads', stdout.getvalue())
+        for lead in Lead.objects.all():
+            self.assertEqual(lead.phone_normalized, normalize_phone(lead.phone))
+            self.assertEqual(lead.email_normalized, normalize_email(lead.email))
+            self.assertEqual(lead.fingerprint, lead_fingerprint(lead.email, lead.phone, lead.source_page))
+
+        call_command('backfill_lead_contacts', stdout=stdout)
+        self.assertIn('on 0 leads', stdout.getvalue())
+
+        admin = CustomUser.objects.create_user(username='lookup', email='lookup@test.com', password='x', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get('/api/leads/', {'phone': f'+971 {leads[3].phone[1:]}'})
+        self.assertEqual([lead['id'] for lead in response.data['results']], [leads[3].id])
+
+
+class LeadEndpointQueryCountTests(CacheTestCase):
+    """Lead list and detail endpoints must not issue per-row queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(
+            username='admin', email='admin@test.com', password='admin123', role='admin'
+        )
+        cls.agents = create_agents(3)
+        cls.leads = create_leads(30, cls.agents)
+        LeadNote.objects.bulk_create([
+            LeadNote(lead=lead, user=author, note=f'Note {i}')
+            for lead in cls.leads
+            for i, author in enumerate([cls.admin, cls.agents[0], None])
+        ])
+        cls.agent = cls.agents[1]
+        cls.agent_lead = cls.agent.assigned_leads.first()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_admin_lead_list(self):
+        client = self.client_for(self.admin)
+        with self.assertNumQueries(2):
+            response = client.get('/api/leads/', {'page_size': 30})
+        self.assertEqual(len(response.data['results']), 30)
+        self.assertEqual(len(response.data['results'][0]['notes_history']), 3)
+
+    def test_admin_lead_detail(self):
+        client = self.client_for(self.admin)
+        with self.assertNumQueries(2):
+            response = client.get(f'/api/leads/{self.agent_lead.id}/')
+        self.assertEqual(response.data['assigned_agent_email'], self.agent.email)
+
+    def test_agent_lead_list(self):
+        client = self.client_for(self.agent)
+        with self.assertNumQueries(2):
+            response = client.get('/api/agent/leads/')
+        self.assertEqual(len(response.data), self.agent.assigned_leads.count())
+
+    def test_agent_lead_detail(self):
+        client = self.client_for(self.agent)
+        with self.assertNumQueries(2):
+            response = client.get(f'/api/agent/leads/{self.agent_lead.id}/')
+        self.assertEqual(len(response.data['notes_history']), 3)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncLoginTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(
+            username='agent', email='agent@test.com', password='secret-pass', role='agent'
+        )
+
+    async def post(self, view, data):
+        request = RequestFactory().post('/', json.dumps(data), content_type='application/json')
+        response = await view.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response.status_code, json.loads(response.content)
+
+    async def test_login(self):
+        status_code, data = await self.post(
+            AsyncLoginView, {'email': 'Agent@Test.com', 'password': 'secret-pass'}
+        )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['user']['id'], self.user.id)
+        self.assertIn('token', data)
+
+        status_code, data = await self.post(
+            AsyncLoginView, {'email': 'agent@test.com', 'password': 'wrong'}
+        )
+        self.assertEqual((status_code, data), (400, {'message': 'Invalid credentials'}))
+
+    async def test_token_obtain(self):
+        status_code, data = await self.post(
+            AsyncTokenObtainPairView, {'email': 'agent@test.com', 'password': 'secret-pass'}
+        )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(set(data), {'refresh', 'access'})
+
+        status_code, data = await self.post(
+            AsyncTokenObtainPairView, {'email': 'missing@test.com', 'password': 'secret-pass'}
+        )
+        self.assertEqual(status_code, 401)
+
+    async def test_failed_logins_hash_only_on_the_pool(self):
+        encode = MD5PasswordHasher.encode
+        threads = []
+
+        def spy(hasher, password, salt):
+            threads.append(threading.current_thread().name)
+            return encode(hasher, password, salt)
+
+        with mock.patch.object(MD5PasswordHasher, 'encode', spy):
+            for view, credentials in (
+                (AsyncLoginView, {'email': 'missing@test.com', 'password': 'secret-pass'}),
+                (AsyncLoginView, {'email': 'agent@test.com', 'password': 'wrong'}),
+                (AsyncTokenObtainPairView, {'email': 'missing@test.com', 'password': 'secret-pass'}),
+                (AsyncTokenObtainPairView, {'email': 'agent@test.com', 'password': 'wrong'}),
+            ):
+                threads.clear()
+                status_code, _ = await self.post(view, credentials)
+                self.assertIn(status_code, (400, 401))
+                # Exactly one hash, and not on the event loop or an unbounded thread
+                self.assertEqual(len(threads), 1, (view.__name__, credentials, threads))
+                self.assertTrue(threads[0].startswith('login-hash_'), threads)
+
+    async def test_hash_queue_is_bounded(self):
+        executor = hashing.HashExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0)
+
+        self.assertEqual(executor.stats()['queue_depth'], 1)
+        with self.assertRaises(hashing.HashQueueFull):
+            await executor.run(release.wait)
+
+        release.set()
+        await asyncio.gather(running, queued)
+        self.assertEqual(executor.stats()['rejected'], 1)
+        self.assertEqual(executor.stats()['queue_depth'], 0)
+
+
+class EmailBackendLookupTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = EmailBackend()
+        self.first = CustomUser.objects.create_user(username='first', email='Dup.Case@Test.com')
+        self.second = CustomUser.objects.create_user(username='second', email='dup.case@test.com')
+        self.mixed = CustomUser.objects.create_user(username='mixed', email='MiXeD@Example.org')
+
+    def test_case_insensitive_lookup(self):
+        self.assertEqual(self.backend.get_user_by_login('  mixed@example.ORG '), self.mixed)
+        # Accounts whose emails differ only by case resolve to the oldest one
+        self.assertEqual(self.backend.get_user_by_login('DUP.CASE@test.com'), self.first)
+        self.assertEqual(self.backend.get_user_by_login('second'), self.second)
+        self.assertIsNone(self.backend.get_user_by_login('missing@test.com'))
+
+    def test_lookup_uses_the_lower_email_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.backend.get_user_by_login('Mixed@Example.org')
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('users_customuser_email_ci_idx', plan)
+
+
+class CachedJWTAuthenticationTests(CacheTestCase):
+    url = '/api/agent/analytics/'
+
+    def setUp(self):
+        super().setUp()
+        self.agent = CustomUser.objects.create_user(
+            username='jwt-agent', email='jwt-agent@test.com', password='x', role='agent'
+        )
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.agent).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def get_user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if 'FROM "users_customuser"' in query['sql']]
+
+    def test_cached_user_skips_users_table(self):
+        self.assertEqual(len(self.get_user_queries()), 1)
+        self.assertEqual(self.get_user_queries(), [])
+
+    def test_save_invalidates_cached_user(self):
+        self.get_user_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.role = 'admin'
+            self.agent.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_deferred_fields_load_together(self):
+        self.get_user_queries()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['user']['email'], 'jwt-agent@test.com')
+
+
+class RevocableTokenRefreshTests(CacheTestCase):
+    url = '/api/token/refresh/'
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent = CustomUser.objects.create_user(
+                username='refresh-agent', email='refresh-agent@test.com', password='x', role='agent'
+            )
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post(self.url, {'refresh': str(token)}, format='json')
+
+    def test_rotated_token_is_rejected(self):
+        token = RefreshToken.for_user(self.agent)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'access', 'refresh'})
+
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_refresh_runs_no_select(self):
+        rotated = self.refresh(RefreshToken.for_user(self.agent)).data['refresh']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh(rotated).status_code, 200)
+        self.assertEqual(
+            [query['sql'] for query in queries if query['sql'].startswith('SELECT')], []
+        )
+
+    def test_revocation_reaches_other_workers(self):
+        other_worker = revocation.RevocationStore(capacity=1000, rebuild_interval=3600)
+        token = RefreshToken.for_user(self.agent)
+        self.assertFalse(other_worker.is_revoked(token['jti']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.refresh(token).status_code, 200)
+        self.assertTrue(other_worker.is_revoked(token['jti']))
+
+    def test_repeated_syncs_do_not_inflate_the_filter_count(self):
+        store = revocation.RevocationStore(capacity=1000, rebuild_interval=3600)
+        for i in range(3):
+            RevokedToken.objects.create(jti=f'jti-{i}', expires_at=timezone.now() + timedelta(days=1))
+        store.sync()
+        for _ in range(5):
+            # Each sync rereads the rows inside SYNC_OVERLAP
+            revocation.bump_version('revoked_tokens')
+            store.sync()
+        self.assertEqual(store._filter.count, 3)
+
+    def test_expired_revocations_are_purged(self):
+        RevokedToken.objects.create(jti='old', expires_at=timezone.now() - timedelta(days=1))
+        RevokedToken.objects.create(jti='live', expires_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(revocation.purge_expired(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class BulkLeadIngestTests(CacheTestCase):
+    url = '/api/leads/bulk/'
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(
+            username='bulk-admin', email='bulk-admin@test.com', password='x', role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_json_array(self):
+        rows = [
+            {'name': 'Ana', 'email': 'Ana@Example.com', 'phone': '050 123 4567'},
+            {'name': 'No email'},
+            {'name': 'Ben', 'email': 'ben@example.com', 'traffic_source': 'google'},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        self.assertEqual([result['index'] for result in response.data['results']], [0, 1, 2])
+        self.assertIn('email', response.data['results'][1]['errors'])
+
+        lead = Lead.objects.get(pk=response.data['results'][0]['lead_id'])
+        self.assertEqual((lead.email_normalized, lead.phone_normalized), ('ana@example.com', '+971501234567'))
+        self.assertEqual(sum(LeadDailyStat.objects.values_list('count', flat=True)), 2)
+        search = self.client.get('/api/leads/', {'search': 'Ben'})
+        self.assertEqual([row['id'] for row in search.data['results']], [response.data['results'][2]['lead_id']])
+
+    def test_ndjson_stream(self):
+        body = b'{"name": "Ana", "email": "ana@example.com"}\n\nnot json\n{"name": "Ben", "email": "ben@example.com"}\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        self.assertIn('Line 3', str(response.data['results'][1]['errors']))
+        self.assertEqual(Lead.objects.count(), 2)
+
+    def test_non_array_body_is_rejected(self):
+        for body in ['{"name": "Ana"}', '42', '"leads"', 'null', 'true']:
+            with self.subTest(body=body):
+                response = self.client.post(self.url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Lead.objects.exists())
+
+
+class LeadWriteBehindTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        queue_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_dir.cleanup)
+        settings_override = override_settings(
+            LEAD_WRITE_BEHIND=True,
+            LEAD_QUEUE_PATH=os.path.join(queue_dir.name, 'queue.sqlite3'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_submission_is_queued_then_drained(self):
+        response = APIClient().post(
+            '/api/public/leads/', {'name': 'Ana', 'email': 'ana@example.com'}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Lead.objects.exists())
+        submitted_at = lead_queue.peek(1)[0][1]['created_at']
+
+        call_command('drain_lead_queue', stdout=io.StringIO())
+        lead = Lead.objects.get()
+        self.assertEqual((lead.email_normalized, lead.created_at), ('ana@example.com', submitted_at))
+        self.assertEqual(LeadDailyStat.objects.get().count, 1)
+        self.assertEqual(lead_queue.size(), 0)
+
+    def test_duplicates_are_dropped_by_the_drain(self):
+        Lead.objects.create(name='Ana', email='ana@example.com')
+        CMSSettings.get_cached_settings()
+        client = APIClient()
+        with self.assertNumQueries(0):
+            for name in ['Ana', 'Ana again', 'Ben']:
+                email = 'ben@example.com' if name == 'Ben' else 'ANA@example.com'
+                response = client.post('/api/public/leads/', {'name': name, 'email': email}, format='json')
+                self.assertEqual(response.status_code, 202)
+        self.assertEqual(lead_queue.size(), 3)
+
+        # The window runs back from the submission time, not the drain
+        drained_at = timezone.now() + timedelta(seconds=settings.LEAD_DEDUP_WINDOW + 60)
+        with mock.patch('django.utils.timezone.now', return_value=drained_at):
+            call_command('drain_lead_queue', stdout=io.StringIO())
+        self.assertEqual(sorted(Lead.objects.values_list('name', flat=True)), ['Ana', 'Ben'])
+        self.assertEqual(lead_queue.size(), 0)
+
+
+class LeadDedupTests(CacheTestCase):
+    url = '/api/public/leads/'
+
+    def setUp(self):
+        super().setUp()
+        # Fingerprints remembered here would outlive the test's rolled back leads
+        patcher = mock.patch.object(dedup, 'recent', dedup.RecentFingerprints(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, **data):
+        return APIClient().post(self.url, data, format='json')
+
+    def test_repeat_submission_returns_existing_lead(self):
+        first = self.submit(name='Ana', email='ana@example.com', phone='050 123 4567', source_page='/villa')
+        self.assertEqual(first.status_code, 201)
+
+        repeat = self.submit(name='Ana M', email='ANA@example.com', phone='+971501234567', source_page='/villa')
+        self.assertEqual(repeat.status_code, 200)
+        self.assertEqual(repeat.data, {'message': 'Lead submitted successfully', 'duplicate': True})
+
+        other_page = self.submit(name='Ana', email='ana@example.com', phone='050 123 4567', source_page='/flat')
+        self.assertEqual(other_page.status_code, 201)
+        self.assertEqual(Lead.objects.count(), 2)
+
+    def test_recent_fingerprint_cache_skips_the_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lead_id = self.submit(name='Ben', email='ben@example.com').data['lead_id']
+        fingerprint = Lead.objects.get(pk=lead_id).fingerprint
+        with self.assertNumQueries(0):
+            self.assertEqual(dedup.find_duplicate(fingerprint), lead_id)
+
+    @override_settings(LEAD_DEDUP_WINDOW=60)
+    def test_window(self):
+        lead_id = self.submit(name='Cy', email='cy@example.com').data['lead_id']
+        Lead.objects.filter(pk=lead_id).update(created_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(self.submit(name='Cy', email='cy@example.com').status_code, 201)
+
+    def test_bulk_rows_are_deduplicated(self):
+        admin = CustomUser.objects.create_user(
+            username='dedup-admin', email='dedup-admin@test.com', password='x', role='admin'
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        existing_id = self.submit(name='Di', email='di@example.com').data['lead_id']
+        rows = [
+            {'name': 'Di', 'email': 'di@example.com'},
+            {'name': 'Ed', 'email': 'ed@example.com'},
+            {'name': 'Ed', 'email': 'ed@example.com'},
+        ]
+        results = client.post('/api/leads/bulk/', rows, format='json').data['results']
+        self.assertEqual(results[0], {'index': 0, 'lead_id': existing_id, 'duplicate': True})
+        self.assertFalse(results[1]['duplicate'])
+        self.assertEqual(results[2], {'index': 2, 'lead_id': results[1]['lead_id'], 'duplicate': True})
+        self.assertEqual(Lead.objects.count(), 2)
+        self.assertEqual(sum(LeadDailyStat.objects.values_list('count', flat=True)), 2)
+
+
+class LeadAssignmentTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The engine keeps agents per process; drop the ones of other tests
+        assignment.engine.invalidate()
+        self.addCleanup(assignment.engine.invalidate)
+        self.busy, self.idle, self.closer = [
+            CustomUser.objects.create_user(username=name, email=f'{name}@test.com', password='x', role='agent')
+            for name in ('busy', 'idle', 'closer')
+        ]
+        CustomUser.objects.create_user(username='away', email='away@test.com', password='x', status='inactive')
+        CustomUser.objects.create_user(username='hidden', email='hidden@test.com', password='x', profile_visible=False)
+        for _ in range(2):
+            Lead.objects.create(name='Open', email='open@example.com', assigned_agent=self.busy)
+        Lead.objects.create(name='Won', email='won@example.com', assigned_agent=self.closer, status='converted')
+
+    def submit(self, **data):
+        response = APIClient().post('/api/public/leads/', {'name': 'Lead', **data}, format='json')
+        return Lead.objects.get(pk=response.data['lead_id']).assigned_agent
+
+    def test_least_loaded_agent_gets_the_lead(self):
+        agents = []
+        for i in range(4):
+            with self.captureOnCommitCallbacks(execute=True):
+                agents.append(self.submit(email=f'least-{i}@example.com'))
+        self.assertEqual(agents, [self.idle, self.closer, self.idle, self.closer])
+
+        # Closing leads frees the agent up, without going back to the database
+        with self.captureOnCommitCallbacks(execute=True):
+            for lead in Lead.objects.filter(assigned_agent=self.busy):
+                lead.status = 'closed_lost'
+                lead.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(assignment.engine.pick(), self.busy.pk)
+
+    def test_rolled_back_lead_is_not_counted(self):
+        self.assertEqual(assignment.engine.pick(), self.idle.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    Lead.objects.create(name='Lost', email='lost@example.com', assigned_agent=self.idle)
+                    raise IntegrityError
+        self.assertEqual(assignment.engine.pick(), self.idle.pk)
+
+    def test_bulk_leads_are_counted_on_commit(self):
+        assignment.engine.pick()
+        counts = dict(assignment.engine._state.peek().counts)
+        rows = [{'name': 'Lead', 'email': f'batch-{i}@example.com'} for i in range(4)]
+
+        with mock.patch.object(QuerySet, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                ingest.create_leads(rows)
+        self.assertFalse(Lead.objects.filter(email__startswith='batch-').exists())
+        self.assertEqual(assignment.engine._state.peek().counts, counts)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.create_leads(rows)
+        agents = Lead.objects.filter(email__startswith='batch-').values_list('assigned_agent', flat=True)
+        self.assertEqual(sorted(agents), sorted([self.idle.pk, self.closer.pk] * 2))
+        counts.update({self.idle.pk: 2, self.closer.pk: 2})
+        self.assertEqual(assignment.engine._state.peek().counts, counts)
+
+    @override_settings(LEAD_ASSIGNMENT_STRATEGY='round_robin', LEAD_ASSIGNMENT_SOURCE_RULES={'google': ['Busy@test.com']})
+    def test_round_robin_and_source_rules_in_bulk(self):
+        assignment.engine.invalidate()
+        rows = [{'name': 'Lead', 'email': f'bulk-{i}@example.com', 'traffic_source': 'google' if i < 2 else 'direct'}
+                for i in range(5)]
+        created = ingest.create_leads(rows)
+        agents = list(Lead.objects.filter(pk__in=[lead_id for lead_id, _ in created])
+                      .order_by('pk').values_list('assigned_agent', flat=True))
+        self.assertEqual(agents, [self.busy.pk, self.busy.pk, self.busy.pk, self.idle.pk, self.closer.pk])
+        self.assertEqual(
+            LeadDailyStat.objects.get(assigned_agent=self.busy, status='new', traffic_source='google').count, 2
+        )
+
+    @override_settings(LEAD_ASSIGNMENT_STRATEGY='none')
+    def test_assignment_can_be_disabled(self):
+        self.assertIsNone(self.submit(email='none@example.com'))
+
+
+class AgentLeadUpdateTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agent = CustomUser.objects.create_user(
+            username='updater', email='updater@test.com', password='x', role='agent'
+        )
+        self.first, self.second = [
+            Lead.objects.create(name=name, email=f'{name}@example.com', assigned_agent=self.agent)
+            for name in ('first', 'second')
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    def test_update_writes_lead_and_notes_together(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/agent/leads/{self.first.id}/',
+                {'status': 'contacted', 'activity_note': 'Called back', 'internal_notes': 'Wants a villa'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [note['note'] for note in response.data['notes_history']],
+            ['Called back', "Status changed from 'new' to 'contacted'"]
+        )
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'contacted')
+        # internal_notes is read-only now that notes are LeadNote rows: the
+        # write is ignored and the field echoes the notes in the old shape
+        self.assertEqual(self.first.internal_notes, {})
+        self.assertIn(
+            {'note': 'Called back', 'author': 'updater', 'timestamp': mock.ANY},
+            list(response.data['internal_notes'].values())
+        )
+        note_inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "users_leadnote"')]
+        self.assertEqual(len(note_inserts), 1)
+
+    def test_batch_applies_every_update(self):
+        response = self.client.post('/api/agent/leads/batch/', [
+            {'id': self.first.id, 'status': 'contacted'},
+            {'id': self.second.id, 'activity_note': 'Left a voicemail'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([lead['id'] for lead in response.data['results']], [self.first.id, self.second.id])
+        self.assertEqual(response.data['results'][0]['status'], 'contacted')
+        self.assertEqual(LeadNote.objects.filter(lead__in=[self.first, self.second]).count(), 2)
+
+    def test_invalid_batch_writes_nothing(self):
+        other = Lead.objects.create(name='other', email='other@example.com')
+        response = self.client.post('/api/agent/leads/batch/', [
+            {'id': self.first.id, 'status': 'contacted', 'activity_note': 'Called'},
+            {'id': self.second.id, 'status': 'converted'},
+            {'id': other.id, 'activity_note': 'Not mine'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'new')
+        self.assertFalse(LeadNote.objects.exists())
+
+    def test_boolean_id_is_not_a_lead(self):
+        # true == 1, so give a lead of this agent that id
+        Lead.objects.filter(pk=self.first.pk).update(id=1)
+        response = self.client.post(
+            '/api/agent/leads/batch/', [{'id': True, 'status': 'contacted'}], format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'index': 0, 'errors': {'id': ['Lead not found']}}])
+        self.assertEqual(Lead.objects.get(pk=1).status, 'new')
+
+
+class LeadNoteStorageTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agent = CustomUser.objects.create_user(
+            username='noter', email='noter@test.com', password='x', role='agent'
+        )
+        self.lead = Lead.objects.create(name='Notes', email='notes@example.com', assigned_agent=self.agent)
+
+    def test_add_note_appends_a_row(self):
+        updated_at = self.lead.updated_at
+        note = self.lead.add_note('Sent the brochure', author=self.agent)
+        self.assertEqual(note.lead, self.lead)
+        self.lead.refresh_from_db()
+        self.assertEqual(self.lead.updated_at, updated_at)
+        self.assertEqual(self.lead.internal_notes, {})
+
+    def test_migrate_internal_notes(self):
+        Lead.objects.filter(pk=self.lead.pk).update(internal_notes={
+            '2024-01-02T09:00:00': {'note': 'Second', 'author': 'noter', 'timestamp': '2024-01-02T09:00:00'},
+            '2024-01-01T09:00:00': {'note': 'First', 'author': 'Old Agent', 'timestamp': '2024-01-01T09:00:00'},
+            'budget': '2M',
+        })
+        call_command('migrate_internal_notes', batch_size=1, stdout=io.StringIO())
+
+        notes = list(self.lead.notes.order_by('created_at'))
+        self.assertEqual([note.note for note in notes], ['Old Agent: First', 'Second', 'budget: 2M'])
+        self.assertEqual(notes[1].user, self.agent)
+        self.assertEqual(notes[0].created_at.date().isoformat(), '2024-01-01')
+        self.lead.refresh_from_db()
+        self.assertIsNone(self.lead.internal_notes)
+
+    def test_admin_shows_internal_notes_read_only(self):
+        admin_user = CustomUser.objects.create_superuser(
+            username='notes-admin', email='notes-admin@test.com', password='x'
+        )
+        self.client.force_login(admin_user)
+        url = f'/admin/users/lead/{self.lead.pk}/change/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="internal_notes"')
+
+        response = self.client.post(url, {
+            'name': 'Notes', 'email': 'notes@example.com', 'status': 'new',
+            'assigned_agent': self.agent.pk, 'internal_notes': '{"typed": "by an admin"}',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.lead.refresh_from_db()
+        self.assertEqual(self.lead.internal_notes, {})
+
+    @override_settings(LEAD_NOTES_LIMIT=2)
+    def test_reads_return_the_newest_notes(self):
+        for i in range(4):
+            self.lead.add_note(f'Note {i}')
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        url = f'/api/agent/leads/{self.lead.id}/'
+
+        notes = client.get(url).data['notes_history']
+        self.assertEqual([note['note'] for note in notes], ['Note 3', 'Note 2'])
+        self.assertEqual(len(client.get(url, {'notes': 'all'}).data['notes_history']), 4)
+        legacy = client.get(url).data['internal_notes']
+        self.assertEqual([entry['note'] for entry in legacy.values()], ['Note 3', 'Note 2'])
+        self.assertEqual({entry['author'] for entry in legacy.values()}, {'System'})
+
+
+class LeadExportTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(
+            username='exporter', email='exporter@test.com', password='x', role='admin'
+        )
+        agent = CustomUser.objects.create_user(
+            username='sam', email='sam@test.com', password='x', role='agent', first_name='Sam', last_name='Lee'
+        )
+        Lead.objects.create(name='Won', email='won@example.com', assigned_agent=agent, status='converted')
+        Lead.objects.create(name='Open', email='open@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, **params):
+        response = self.client.get('/api/leads/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_applies_the_list_filters(self):
+        with self.assertNumQueries(1):
+            content = self.export(format='csv', status='converted')
+        [row] = csv.DictReader(io.StringIO(content))
+        self.assertEqual((row['name'], row['assigned_agent_name']), ('Won', 'Sam Lee'))
+        self.assertEqual(row['assigned_agent_email'], 'sam@test.com')
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export(format='ndjson').splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Open', 'Won'])
+        self.assertIsNone(rows[0]['assigned_agent_name'])
+
+    def test_errors_are_rendered_as_json(self):
+        agent = CustomUser.objects.get(username='sam')
+        self.client.force_authenticate(agent)
+        for params in [{'format': 'csv'}, {'format': 'ndjson'}, {}]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/leads/export/', params)
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('detail', response.json())
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/leads/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    @override_settings(EXPORT_CHUNK_SIZE=1)
+    async def test_asgi_export_streams_chunks(self):
+        token = RefreshToken.for_user(self.admin).access_token
+        client = AsyncClient()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await client.get(
+                '/api/leads/export/', {'format': 'ndjson'}, headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertEqual(response.status_code, 200)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([json.loads(chunk)['name'] for chunk in chunks], ['Open', 'Won'])
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
+
+    def test_renderers_share_the_streaming(self):
+        with self.assertRaises(TypeError):
+            StreamingRenderer()
+        rows = [{'a': 1, 'b': 'x'}, {'a': 2, 'b': None}]
+        self.assertEqual(list(CSVRenderer().stream(rows, ['a', 'b'], chunk_size=1)), ['a,b\r\n', '1,x\r\n', '2,\r\n'])
+        self.assertEqual(
+            NDJSONRenderer().render(rows).decode(),
+            '{"a": 1, "b": "x"}\n{"a": 2, "b": null}\n'
+        )
+
+
+class DealLedgerExportTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(
+            username='finance', email='finance@test.com', password='x', role='admin'
+        )
+        self.agent = CustomUser.objects.create_user(
+            username='closer', email='closer@test.com', password='x', role='agent'
+        )
+        deals = [
+            ('2024-01-10', 'AED', '1000.00', '2.00', self.agent),
+            ('2024-01-05', 'USD', '500.00', None, None),
+            ('2024-02-01', 'AED', '3000.00', '1.00', self.agent),
+            ('2024-03-01', 'AED', '9000.00', '5.00', None),
+        ]
+        for i, (closed_date, currency, revenue, rate, agent) in enumerate(deals):
+            lead = Lead.objects.create(
+                name=f'Buyer {i}', email=f'buyer{i}@example.com', status='converted', assigned_agent=agent
+            )
+            Deal.objects.create(
+                lead=lead, closed_date=closed_date, currency=currency,
+                revenue_amount=Decimal(revenue), commission_rate=rate and Decimal(rate)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, **params):
+        response = self.client.get('/api/deals/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_running_totals_per_currency(self):
+        with self.assertNumQueries(1):
+            rows = list(csv.DictReader(io.StringIO(self.export(end_date='2024-02-28'))))
+        self.assertEqual([row['closed_date'] for row in rows], ['2024-01-05', '2024-01-10', '2024-02-01'])
+        self.assertEqual(
+            [(row['currency'], row['running_revenue'], row['running_commission']) for row in rows],
+            [('USD', '500.00', '0.00'), ('AED', '1000.00', '20.00'), ('AED', '4000.00', '50.00')]
+        )
+        self.assertEqual(rows[1]['agent_name'], 'closer')
+
+    def test_ndjson_agent_filter(self):
+        lines = self.export(format='ndjson', agent_id=self.agent.id).splitlines()
+        self.assertEqual([json.loads(line)['running_revenue'] for line in lines], ['1000.00', '4000.00'])
+
+
+def image_upload(name, size, mode='RGB', format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'teal').save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0, IMAGE_VARIANT_WIDTHS=[320, 640, 1280])
+class ImageVariantTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_upload_gets_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prop = Property.objects.create(
+                title='Villa', location='Palm', price='1M', img=image_upload('villa.jpg', (1600, 1200))
+            )
+        prop.refresh_from_db()
+        self.assertEqual(prop.img_variants['source'], prop.img.name)
+        self.assertEqual(list(prop.img_variants['webp']), ['320', '640', '1280'])
+        with Image.open(prop.img.storage.path(prop.img_variants['webp']['640'])) as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (640, 480)))
+
+        srcset = PropertySerializer(prop).data['img_srcset']
+        self.assertTrue(srcset['jpeg']['1280'].endswith('/media/properties/variants/villa.jpg-1280w.jpg'))
+        self.assertNotIn('img_variants', PropertySerializer(prop).data)
+
+    def test_variants_change_the_etag(self):
+        # The on_commit hook doesn't run, so the upload has no variants yet
+        prop = Property.objects.create(
+            title='Villa', location='Palm', price='1M', img=image_upload('villa.jpg', (800, 600))
+        )
+        client = APIClient()
+        url = f'/api/properties/{prop.pk}/'
+        etag = client.get(url)['ETag']
+
+        images.schedule(Property, prop.pk, 'img', prop.img.name)
+        response = client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['img_srcset']['webp']), ['320', '640', '800'])
+
+    def test_same_name_with_other_extension_keeps_its_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jpeg = Slide.objects.create(title='JPEG', location='Palm', img=image_upload('villa.jpg', (400, 300)))
+            png = Slide.objects.create(
+                title='PNG', location='Palm', img=image_upload('villa.png', (600, 200), 'RGBA', 'PNG')
+            )
+        jpeg.refresh_from_db()
+        png.refresh_from_db()
+        self.assertNotEqual(jpeg.img_variants['webp']['320'], png.img_variants['webp']['320'])
+        with Image.open(jpeg.img.storage.path(jpeg.img_variants['webp']['320'])) as variant:
+            self.assertEqual(variant.size, (320, 240))
+
+    def test_corrupt_upload_is_logged_not_raised(self):
+        with self.assertLogs('users.images', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                slide = Slide.objects.create(
+                    title='Broken', location='Palm', img=SimpleUploadedFile('broken.jpg', b'not an image')
+                )
+        self.assertIn('broken', logs.output[0])
+        slide.refresh_from_db()
+        self.assertEqual(slide.img_variants, {})
+
+    def test_backfill_command(self):
+        slide = Slide.objects.create(
+            title='Slide', location='Marina', img=image_upload('logo.png', (500, 100), 'RGBA', 'PNG')
+        )
+        self.assertEqual(slide.img_variants, {})
+
+        call_command('generate_image_variants', workers=0, stdout=io.StringIO())
+        slide.refresh_from_db()
+        self.assertEqual(list(slide.img_variants['jpeg']), ['320', '500'])
+        with Image.open(slide.img.storage.path(slide.img_variants['jpeg']['500'])) as variant:
+            self.assertEqual(variant.mode, 'RGB')
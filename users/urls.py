@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -8,7 +9,7 @@ from .views import (
     RegisterView, UserProfileView, LeadViewSet, 
     AgentLeadViewSet, PublicLeadViewSet, AdminAnalyticsViewSet,
     AgentAnalyticsViewSet, HeroViewSet, PublicHeroViewSet,
-    DealViewSet, AgentRevenueView
+    DealViewSet, AgentRevenueView, PublicHomeView, AsyncLoginView, LoginQueueView
 )
 
 router = DefaultRouter()
@@ -33,6 +34,9 @@ public_router.register(r'agents', PublicAgentViewSet, basename='public-agent')
 public_router.register(r'leads', PublicLeadViewSet, basename='public-lead')
 public_router.register(r'hero', PublicHeroViewSet, basename='public-hero')
 
+# Under ASGI the login is served by the async view (see ASYNC_LOGIN)
+login_view = AsyncLoginView if settings.ASYNC_LOGIN else LoginView
+
 # Agent ViewSets  
 agent_router = DefaultRouter()
 agent_router.register(r'leads', AgentLeadViewSet, basename='agent-lead')
@@ -41,9 +45,11 @@ agent_router.register(r'analytics', AgentAnalyticsViewSet, basename='agent-analy
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('public/home/', PublicHomeView.as_view(), name='public-home'),
     path('public/', include(public_router.urls)),
     path('agent/', include(agent_router.urls)),
-    path('login/', LoginView.as_view(), name='login'),
+    path('login/', login_view.as_view(), name='login'),
+    path('login/queue/', LoginQueueView.as_view(), name='login-queue'),
     path('register/', RegisterView.as_view(), name='register'),
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('agent/revenue/', AgentRevenueView.as_view(), name='agent-revenue'),
@@ -1,23 +1,69 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Q, F, Expression
+from django.db import transaction
+from django.db.models import Count, Q, F, Expression, Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 from django.utils.timezone import now
 from datetime import timedelta
-from django.contrib.auth import authenticate
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, authenticate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import hashlib
+import json
+from types import GeneratorType
+from . import dedup, hashing, lead_queue, search
+from .assignment import engine as assignment_engine
+from .cache import VersionedLocalCache
+from .ingest import ingest_leads
+from .pagination import LeadCursorPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer, StreamingRenderer
+from .search import search_leads
 from .serializers import (
     LoginSerializer, UserSerializer, PropertySerializer, CollaborationSerializer, 
     SlideSerializer, YourPerfectSerializer, SidebarCardSerializer, DamacSerializer,
     EmpoweringCommunitiesSerializer, CMSSettingsSerializer, AgentSerializer,
     LeadSerializer, AgentLeadSerializer, PublicLeadSerializer, HeroSerializer,
     PublicHeroSerializer, LeadNoteSerializer, DealSerializer, AgentDealSerializer, 
-    AgentRevenueSerializer, ProfileUpdateSerializer
+    AgentRevenueSerializer, ProfileUpdateSerializer, AsyncTokenObtainPairSerializer
 )
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .permissions import IsAdminOrReadOnly, IsAdminOrSelf, IsAdminUser, IsAdminRole, IsAgentRole, IsAdminOrAgentRole, IsAdminOnly
-from .models import CustomUser, Property, Collaboration, Slide, YourPerfect, SidebarCard, Damac, EmpoweringCommunities, CMSSettings, Lead, LeadNote, Hero, Deal
+from .models import CustomUser, Property, Collaboration, Slide, YourPerfect, SidebarCard, Damac, EmpoweringCommunities, CMSSettings, Lead, LeadNote, Hero, Deal, LeadDailyStat, lead_fingerprint, normalize_email, normalize_phone, user_display_name
+
+
+def login_response_data(user):
+    """Token and user summary returned by the login views"""
+    refresh = RefreshToken.for_user(user)
+    access_token = str(refresh.access_token)
+
+    return {
+        "user": {
+            "id": user.id,
+            "name": user.username, 
+            "email": user.email,
+            "role": user.role,  # Use role field from CustomUser
+            "is_admin": user.is_admin_role,  # Helper property
+            "is_agent": user.is_agent_role,  # Helper property
+        },
+        "token": access_token
+    }
 
 
 class LoginView(APIView):
@@ -32,30 +78,101 @@ class LoginView(APIView):
             user = authenticate(request, username=email, password=password)
             
             if user is not None:
-                refresh = RefreshToken.for_user(user)
-                access_token = str(refresh.access_token)
-
-                user_data = {
-                    "user": {
-                        "id": user.id,
-                        "name": user.username, 
-                        "email": user.email,
-                        "role": user.role,  # Use role field from CustomUser
-                        "is_admin": user.is_admin_role,  # Helper property
-                        "is_agent": user.is_agent_role,  # Helper property
-                    },
-                    "token": access_token
-                }
-
-                return Response(user_data, status=status.HTTP_200_OK)
+                return Response(login_response_data(user), status=status.HTTP_200_OK)
 
             else:
                 return Response({"message": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
 
 
+def parse_request_data(request):
+    """Request body as a dict for the plain Django views (JSON or form data)"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+LOGIN_BUSY_RESPONSE = {"message": "Too many logins in progress, please retry shortly"}
+
+
+def login_busy_response():
+    response = JsonResponse(LOGIN_BUSY_RESPONSE, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLoginView(View):
+    """
+    LoginView for ASGI deployments (see ASYNC_LOGIN): the password check is
+    awaited on the bounded hashing pool so the event loop keeps serving
+    other requests during a burst of logins
+    """
+    http_method_names = ['post']
+
+    async def post(self, request):
+        data = parse_request_data(request)
+        if data is None:
+            return JsonResponse({"detail": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = LoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await aauthenticate(
+                request,
+                username=serializer.validated_data['email'],
+                password=serializer.validated_data['password'],
+            )
+        except hashing.HashQueueFull:
+            return login_busy_response()
+
+        if user is None:
+            return JsonResponse({"message": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(login_response_data(user), status=status.HTTP_200_OK)
+
+
+class AsyncTokenObtainPairView(TokenObtainPairView):
+    """
+    TokenObtainPairView for ASGI deployments, see AsyncLoginView. The
+    credentials are checked with aauthenticate() before the usual view runs
+    (in a thread, as Django runs sync views) and issues the pair for that user.
+    """
+    serializer_class = AsyncTokenObtainPairSerializer
+    # dispatch() is a coroutine; TokenObtainPairView's post() is not
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        data = parse_request_data(request) or {}
+        username = data.get(AsyncTokenObtainPairSerializer.username_field)
+        password = data.get('password')
+
+        self.authenticated_user = None
+        if isinstance(username, str) and isinstance(password, str):
+            # Invalid fields are left for the serializer to report
+            try:
+                self.authenticated_user = await aauthenticate(request, username=username, password=password)
+            except hashing.HashQueueFull:
+                return login_busy_response()
+
+        return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'user': self.authenticated_user}
+
+
+class LoginQueueView(APIView):
+    """Admin: state of the login password-hashing pool in this worker"""
+    permission_classes = [IsAdminOnly]
+
+    def get(self, request):
+        return Response(hashing.executor.stats())
+
 
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]  # Require authentication for profile access
@@ -163,7 +280,50 @@ class UserViewSet(viewsets.ModelViewSet):
     
 
 
-class PropertyViewSet(viewsets.ModelViewSet):
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on list and retrieve with a 304
+    before serialization, using validators derived from MAX(updated_at) and
+    the row count of the requested queryset
+    """
+    
+    def make_validators(self, model, count, last_modified):
+        """Return (etag, last_modified timestamp) for count rows of model last updated at last_modified"""
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        version = last_modified.isoformat() if last_modified else '0'
+        etag = '"%s-%s-%s"' % (model._meta.model_name, count, version)
+        return etag, timestamp
+    
+    def get_validators(self, queryset):
+        """Return (etag, last_modified timestamp) for a queryset in one query"""
+        state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        return self.make_validators(queryset.model, state['count'], state['last_modified'])
+    
+    def conditional_response(self, request, validators, view_method, *args, **kwargs):
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view_method(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(request, self.get_validators(queryset), super().list, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        # get_object() answers a missing or malformed pk with a 404
+        instance = self.get_object()
+        validators = self.make_validators(type(instance), 1, instance.updated_at)
+        return self.conditional_response(
+            request, validators, lambda request: Response(self.get_serializer(instance).data)
+        )
+
+
+class PropertyViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Property.objects.all()
     serializer_class = PropertySerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -182,41 +342,41 @@ class PropertyViewSet(viewsets.ModelViewSet):
 
 
 
-class CollaborationViewSet(viewsets.ModelViewSet):
+class CollaborationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Collaboration.objects.all()
     serializer_class = CollaborationSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
 
-class SlideViewSet(viewsets.ModelViewSet):
+class SlideViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Slide.objects.all()
     serializer_class = SlideSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
-class YourPerfectViewSet(viewsets.ModelViewSet):
+class YourPerfectViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = YourPerfect.objects.all()
     serializer_class = YourPerfectSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
 
-class SidebarCardViewSet(viewsets.ModelViewSet):
+class SidebarCardViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = SidebarCard.objects.all()
     serializer_class = SidebarCardSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
 
-class DamacViewSet(viewsets.ModelViewSet):
+class DamacViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Damac.objects.all()
     serializer_class = DamacSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
 
-class EmpoweringCommunitiesViewSet(viewsets.ModelViewSet):
+class EmpoweringCommunitiesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = EmpoweringCommunities.objects.all()
     serializer_class = EmpoweringCommunitiesSerializer
     permission_classes = [IsAdminOrReadOnly]
@@ -256,7 +416,7 @@ class CMSSettingsViewSet(viewsets.ModelViewSet):
         """
         Return the single CMS settings instance
         """
-        settings = CMSSettings.get_settings()
+        settings = CMSSettings.get_cached_settings()
         serializer = self.get_serializer(settings)
         return Response(serializer.data)
     
@@ -298,7 +458,7 @@ class PublicAgentViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Return only active, visible agents if CMS allows"""
         # Check if agents section is enabled in CMS settings
-        cms_settings = CMSSettings.get_settings()
+        cms_settings = CMSSettings.get_cached_settings()
         
         if not cms_settings.agentsSection:
             return CustomUser.objects.none()
@@ -310,17 +470,97 @@ class PublicAgentViewSet(viewsets.ReadOnlyModelViewSet):
         )
 
 
-class LeadViewSet(viewsets.ModelViewSet):
+def filter_by_contact(queryset, query_params):
+    """Apply exact ?phone= / ?email= lookups through the normalized lead columns"""
+    phone = query_params.get('phone')
+    if phone:
+        queryset = queryset.filter(phone_normalized=normalize_phone(phone))
+    
+    email = query_params.get('email')
+    if email:
+        queryset = queryset.filter(email_normalized=normalize_email(email))
+    
+    return queryset
+
+
+# Columns of /api/leads/export/, besides assigned_agent_name and assigned_agent_email
+LEAD_EXPORT_FIELDS = [
+    'id', 'name', 'email', 'phone', 'source_page', 'traffic_source',
+    'utm_source', 'utm_medium', 'utm_campaign', 'status', 'assigned_agent',
+    'created_at', 'updated_at',
+]
+
+
+async def iterate_in_thread(iterator):
+    """
+    Async generator over a sync iterator, each next() run through
+    sync_to_async, so an ASGI server can send a chunk as soon as it is read
+    """
+    iterator = iter(iterator)
+    done = object()
+    while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+        yield chunk
+
+
+def streaming_export(request, rows, fields, name):
+    """
+    Stream rows (dicts keyed by fields) through the renderer DRF negotiated
+    (see users/renderers.py) as a file download
+    """
+    renderer = request.accepted_renderer
+    chunks = renderer.stream(rows, fields, chunk_size=settings.EXPORT_CHUNK_SIZE)
+    if isinstance(request._request, ASGIRequest):
+        # Under ASGI, Django would read a sync iterator into a list before
+        # sending the first byte
+        chunks = iterate_in_thread(chunks)
+    response = StreamingHttpResponse(
+        chunks,
+        content_type=f'{renderer.media_type}; charset={renderer.charset}'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}-{timezone.localdate():%Y%m%d}.{renderer.format}"'
+    )
+    return response
+
+
+class StreamingExportMixin:
+    """
+    For viewsets with a streaming export action: errors raised there (a
+    403, an unknown ?format) are rendered as JSON, not as a one-row file
+    """
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        if isinstance(response, Response) and response.exception:
+            renderer = getattr(request, 'accepted_renderer', None) or self.get_renderers()[0]
+            if isinstance(renderer, StreamingRenderer):
+                request.accepted_renderer = JSONRenderer()
+                request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def notes_limit(query_params):
+    """Number of newest notes to return per lead for ?notes=<n> (0 for ?notes=all)"""
+    value = query_params.get('notes')
+    if value == 'all':
+        return 0
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return settings.LEAD_NOTES_LIMIT
+
+
+class LeadViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for Lead management (admin-only)
     """
     serializer_class = LeadSerializer
     permission_classes = [IsAdminOnly]
+    pagination_class = LeadCursorPagination
     queryset = Lead.objects.all()
     
     def get_queryset(self):
         """Filter leads by status, agent, and traffic source if provided"""
-        queryset = Lead.objects.all()
+        queryset = Lead.objects.with_related(notes_limit(self.request.query_params))
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
@@ -342,17 +582,40 @@ class LeadViewSet(viewsets.ModelViewSet):
         if utm_campaign_filter:
             queryset = queryset.filter(utm_campaign=utm_campaign_filter)
         
-        # Filter by source page
-        source_page_filter = self.request.query_params.get('source_page')
-        if source_page_filter:
-            queryset = queryset.filter(source_page__icontains=source_page_filter)
+        # Exact contact lookups on the normalized columns
+        queryset = filter_by_contact(queryset, self.request.query_params)
+        
+        # Full-text search and source page filter (ranked by relevance when searching)
+        queryset = search_leads(
+            queryset,
+            search=self.request.query_params.get('search'),
+            source_page=self.request.query_params.get('source_page'),
+        )
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """
+        List leads; searches return the LEAD_SEARCH_LIMIT best matches
+        unpaginated, by relevance, with truncated set when there are more
+        """
+        if not request.query_params.get('search'):
+            return super().list(request, *args, **kwargs)
+        
+        limit = settings.LEAD_SEARCH_LIMIT
+        leads = list(self.filter_queryset(self.get_queryset())[:limit + 1])
+        serializer = self.get_serializer(leads[:limit], many=True)
+        return Response({
+            'next': None,
+            'previous': None,
+            'truncated': len(leads) > limit,
+            'results': serializer.data,
+        })
+    
     def perform_create(self, serializer):
         """Handle lead creation with CMS check"""
         # Check if lead form is enabled in CMS settings
-        cms_settings = CMSSettings.get_settings()
+        cms_settings = CMSSettings.get_cached_settings()
         
         if not cms_settings.leadFormSection:
             return Response(
@@ -363,6 +626,43 @@ class LeadViewSet(viewsets.ModelViewSet):
         # Create lead
         lead = serializer.save()
         return Response(LeadSerializer(lead).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many leads from a JSON array or an NDJSON stream of objects in
+        the PublicLeadSerializer shape; returns a result per row
+        """
+        rows = request.data
+        # A list from JSONParser or the row generator from NDJSONParser; a
+        # bare object, string or number is not a batch of leads
+        if not isinstance(rows, (list, GeneratorType)):
+            return Response(
+                {'detail': 'Expected a JSON array or NDJSON stream of leads'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = ingest_leads(rows)
+        created = sum('lead_id' in result for result in results)
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        })
+    
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream every lead matching the list filters as CSV (?format=csv, the
+        default) or NDJSON (?format=ndjson). Rows are read in chunks of
+        EXPORT_CHUNK_SIZE, so memory use doesn't grow with the export.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.query.order_by:
+            queryset = queryset.order_by('-created_at', '-id')
+        rows = queryset.export_values(*LEAD_EXPORT_FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        fields = LEAD_EXPORT_FIELDS + ['assigned_agent_name', 'assigned_agent_email']
+        return streaming_export(request, rows, fields, 'leads')
 
 
 class AgentLeadViewSet(viewsets.ModelViewSet):
@@ -374,54 +674,129 @@ class AgentLeadViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Return only leads assigned to current agent with filtering"""
-        queryset = Lead.objects.filter(assigned_agent=self.request.user)
+        queryset = Lead.objects.with_related(notes_limit(self.request.query_params)).filter(
+            assigned_agent=self.request.user
+        )
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         
-        # Filter by search (name, email, phone)
-        search_filter = self.request.query_params.get('search')
-        if search_filter:
-            queryset = queryset.filter(
-                Q(name__icontains=search_filter) |
-                Q(email__icontains=search_filter) |
-                Q(phone__icontains=search_filter)
-            )
+        # Exact contact lookups on the normalized columns
+        queryset = filter_by_contact(queryset, self.request.query_params)
+        
+        # Full-text search (name, email, phone, source page, notes), best match first
+        queryset = search_leads(queryset, search=self.request.query_params.get('search'))
         
         return queryset
     
     def update(self, request, *args, **kwargs):
         """Handle lead updates with status transition validation and note creation"""
         instance = self.get_object()
-        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer, notes = self.prepare_update(instance, request.data)
         
-        if serializer.is_valid():
-            # Handle status change
-            if 'status' in request.data and request.data['status'] != instance.status:
-                note_text = f"Status changed from '{instance.status}' to '{request.data['status']}'"
-                LeadNote.objects.create(
-                    lead=instance,
-                    user=request.user,
-                    note=note_text
-                )
+        if notes is not None:
+            self.save_updates([(serializer, notes)])
             
-            # Handle activity note
-            if 'activity_note' in request.data and request.data['activity_note']:
-                LeadNote.objects.create(
-                    lead=instance,
-                    user=request.user,
-                    note=request.data['activity_note']
-                )
-                # Remove activity_note from the data before saving
-                request.data.pop('activity_note')
-            
-            self.perform_update(serializer)
+            # Re-read so the response includes the notes written above
+            serializer.instance = Lead.objects.with_related(notes_limit(request.query_params)).get(pk=instance.pk)
             return Response(serializer.data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Apply several lead updates at once, e.g. queued by the mobile app:
+        a JSON array of update bodies, each with the lead's id. Either every
+        update is applied, in one transaction, or none is and the errors are
+        returned per item.
+        """
+        items = request.data
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return Response(
+                {'detail': 'Expected a JSON array of lead updates'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.AGENT_LEAD_BATCH_MAX_SIZE:
+            return Response(
+                {'detail': f'At most {settings.AGENT_LEAD_BATCH_MAX_SIZE} updates per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # type() rather than isinstance(): JSON true/false are not lead ids
+        ids = [item.get('id') if type(item.get('id')) is int else None for item in items]
+        leads = Lead.objects.filter(assigned_agent=request.user).in_bulk(
+            [lead_id for lead_id in ids if lead_id is not None]
+        )
+        updates, errors, seen = [], [], set()
+        for index, (item, lead_id) in enumerate(zip(items, ids)):
+            lead = leads.get(lead_id)
+            if lead is None:
+                errors.append({'index': index, 'errors': {'id': ['Lead not found']}})
+                continue
+            if lead.pk in seen:
+                errors.append({'index': index, 'errors': {'id': ['Lead updated twice in one batch']}})
+                continue
+            seen.add(lead.pk)
+            
+            serializer, notes = self.prepare_update(lead, item)
+            if notes is None:
+                errors.append({'index': index, 'errors': serializer.errors})
+            else:
+                updates.append((serializer, notes))
+        
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        self.save_updates(updates)
+        
+        updated = Lead.objects.with_related(notes_limit(request.query_params)).in_bulk(list(seen))
+        return Response({
+            'results': self.get_serializer([updated[item['id']] for item in items], many=True).data
+        })
+    
+    def prepare_update(self, instance, data):
+        """
+        Validate an update of instance. Returns (serializer, notes), where
+        notes are the unsaved notes recording the status change and the
+        activity note, or None when the data is invalid.
+        """
+        serializer = self.get_serializer(instance, data=data, partial=True)
+        if not serializer.is_valid():
+            return serializer, None
+        
+        notes = []
+        new_status = serializer.validated_data.get('status')
+        if new_status is not None and new_status != instance.status:
+            notes.append(LeadNote(
+                lead=instance,
+                user=self.request.user,
+                note=f"Status changed from '{instance.status}' to '{new_status}'"
+            ))
+        
+        # activity_note is not a serializer field, so it never reaches the lead
+        if data.get('activity_note'):
+            notes.append(LeadNote(lead=instance, user=self.request.user, note=data['activity_note']))
+        
+        return serializer, notes
+    
+    def save_updates(self, updates):
+        """
+        Save (serializer, notes) pairs from prepare_update() in one
+        transaction, with a single insert for all of the notes
+        """
+        notes = [note for _, lead_notes in updates for note in lead_notes]
+        with transaction.atomic():
+            for serializer, _ in updates:
+                self.perform_update(serializer)
+            # bulk_create() skips the LeadNote signal that re-indexes notes
+            LeadNote.objects.bulk_create(notes)
+            if search.fts_enabled():
+                for lead_id in {note.lead_id for note in notes}:
+                    search.index_lead_notes(lead_id)
+    
     def perform_create(self, serializer):
         """Agents cannot create leads"""
         return Response(
@@ -447,7 +822,7 @@ class PublicLeadViewSet(viewsets.GenericViewSet):
     def create(self, request, *args, **kwargs):
         """Create lead from public form"""
         # Check if lead form is enabled in CMS settings
-        cms_settings = CMSSettings.get_settings()
+        cms_settings = CMSSettings.get_cached_settings()
         
         if not cms_settings.leadFormSection:
             return Response(
@@ -457,7 +832,27 @@ class PublicLeadViewSet(viewsets.GenericViewSet):
         
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            lead = serializer.save()
+            data = serializer.validated_data
+            if settings.LEAD_WRITE_BEHIND:
+                # Created, and deduplicated, later by drain_lead_queue, so
+                # the main database isn't read here and there is no id yet
+                lead_queue.enqueue(data)
+                return Response(
+                    {'message': 'Lead submitted successfully'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
+            # Double-clicks and platform retries don't create another lead;
+            # the existing lead's id is not given to anonymous callers
+            fingerprint = lead_fingerprint(data.get('email'), data.get('phone'), data.get('source_page'))
+            if dedup.find_duplicate(fingerprint) is not None:
+                return Response(
+                    {'message': 'Lead submitted successfully', 'duplicate': True},
+                    status=status.HTTP_200_OK
+                )
+            
+            lead = serializer.save(assigned_agent_id=assignment_engine.pick(data.get('traffic_source')))
+            transaction.on_commit(lambda: dedup.remember([lead]))
             return Response(
                 {'message': 'Lead submitted successfully', 'lead_id': lead.id},
                 status=status.HTTP_201_CREATED
@@ -483,21 +878,21 @@ class AdminAnalyticsViewSet(viewsets.ViewSet):
             date_to = request.query_params.get('date_to')
             agent_id = request.query_params.get('agent_id')
             
-            # Base queryset
-            queryset = Lead.objects.all()
+            # Base queryset (daily rollup, see LeadDailyStat)
+            queryset = LeadDailyStat.objects.all()
             
             # Apply date filters with proper parsing
             if date_from:
                 try:
                     date_from_parsed = datetime.strptime(date_from, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__gte=date_from_parsed)
+                    queryset = queryset.filter(day__gte=date_from_parsed)
                 except ValueError:
                     pass  # Invalid date format, ignore filter
             
             if date_to:
                 try:
                     date_to_parsed = datetime.strptime(date_to, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__lte=date_to_parsed)
+                    queryset = queryset.filter(day__lte=date_to_parsed)
                 except ValueError:
                     pass  # Invalid date format, ignore filter
             
@@ -505,42 +900,65 @@ class AdminAnalyticsViewSet(viewsets.ViewSet):
             if agent_id and agent_id.isdigit():
                 queryset = queryset.filter(assigned_agent_id=int(agent_id))
             
+            # Status breakdown (also yields the overview totals)
+            status_breakdown = list(
+                queryset.values('status').annotate(count=Sum('count'))
+                .filter(count__gt=0).order_by('status')
+            )
+            status_counts = {item['status']: item['count'] for item in status_breakdown}
+            
             # Overall stats
-            total_leads = queryset.count()
-            converted_leads = queryset.filter(status='converted').count()
-            closed_lost_leads = queryset.filter(status='closed_lost').count()
+            total_leads = sum(status_counts.values())
+            converted_leads = status_counts.get('converted', 0)
+            closed_lost_leads = status_counts.get('closed_lost', 0)
             
             # Conversion rate calculation
             conversion_rate = 0
             if total_leads > 0:
                 conversion_rate = (converted_leads / total_leads) * 100
             
-            # Status breakdown
-            status_breakdown = queryset.values('status').annotate(count=Count('id')).order_by('status')
-            
             # Traffic breakdown
-            traffic_breakdown = queryset.values('traffic_source').annotate(count=Count('id')).order_by('-count')
+            traffic_breakdown = (
+                queryset.values('traffic_source').annotate(count=Sum('count'))
+                .filter(count__gt=0).order_by('-count')
+            )
             
-            # Agent performance
+            # Agent performance: one grouped query over the filtered rollup,
+            # merged with the agent list so agents without leads still appear
+            agent_counts = {
+                row['assigned_agent_id']: row
+                for row in queryset.filter(assigned_agent__isnull=False)
+                .values('assigned_agent_id')
+                .annotate(
+                    total=Sum('count'),
+                    converted=Sum('count', filter=Q(status='converted')),
+                )
+                .order_by()
+            }
+            agents = CustomUser.objects.filter(role='agent').values(
+                'id', 'first_name', 'last_name', 'email'
+            )
             agent_stats = []
-            agents = CustomUser.objects.filter(role='agent')
             for agent in agents:
-                agent_leads = queryset.filter(assigned_agent=agent)
-                agent_converted = agent_leads.filter(status='converted').count()
-                agent_total = agent_leads.count()
+                counts = agent_counts.get(agent['id'], {})
+                agent_total = counts.get('total') or 0
+                agent_converted = counts.get('converted') or 0
                 agent_rate = (agent_converted / agent_total * 100) if agent_total > 0 else 0
+                agent_name = f"{agent['first_name']} {agent['last_name']}".strip()
                 
                 agent_stats.append({
-                    'agent_id': agent.id,
-                    'agent_name': agent.get_full_name() or agent.email,
+                    'agent_id': agent['id'],
+                    'agent_name': agent_name or agent['email'],
                     'total_leads': agent_total,
                     'converted_leads': agent_converted,
                     'conversion_rate': round(agent_rate, 2),
                 })
             
             # Recent leads (last 30 days)
-            recent_date = now() - timedelta(days=30)
-            recent_leads = Lead.objects.filter(created_at__gte=recent_date).count()
+            recent_date = timezone.localdate() - timedelta(days=30)
+            recent_leads = LeadDailyStat.objects.filter(
+                day__gte=recent_date
+            ).aggregate(total=Sum('count'))['total'] or 0
             
             data = {
                 'overview': {
@@ -550,7 +968,7 @@ class AdminAnalyticsViewSet(viewsets.ViewSet):
                     'conversion_rate': round(conversion_rate, 2),
                     'recent_leads': recent_leads,
                 },
-                'status_breakdown': list(status_breakdown),
+                'status_breakdown': status_breakdown,
                 'traffic_breakdown': list(traffic_breakdown),
                 'agent_performance': agent_stats,
             }
@@ -585,11 +1003,13 @@ class AgentAnalyticsViewSet(viewsets.ViewSet):
             date_to   = request.query_params.get('date_to')
             
             queryset = Lead.objects.filter(assigned_agent=agent)
+            stats = LeadDailyStat.objects.filter(assigned_agent=agent)
             
             if date_from:
                 try:
                     date_from_parsed = datetime.strptime(date_from, '%Y-%m-%d').date()
                     queryset = queryset.filter(created_at__date__gte=date_from_parsed)
+                    stats = stats.filter(day__gte=date_from_parsed)
                 except ValueError:
                     pass
             
@@ -597,43 +1017,35 @@ class AgentAnalyticsViewSet(viewsets.ViewSet):
                 try:
                     date_to_parsed = datetime.strptime(date_to, '%Y-%m-%d').date()
                     queryset = queryset.filter(created_at__date__lte=date_to_parsed)
+                    stats = stats.filter(day__lte=date_to_parsed)
                 except ValueError:
                     pass
             
-            total_leads         = queryset.count()
-            new_leads           = queryset.filter(status='new').count()
-            contacted_leads     = queryset.filter(status='contacted').count()
-            in_progress_leads   = queryset.filter(status='in_progress').count()
-            converted_leads     = queryset.filter(status='converted').count()
-            closed_lost_leads   = queryset.filter(status='closed_lost').count()
-            
-            conversion_rate = (converted_leads / total_leads * 100) if total_leads > 0 else 0
-            
-            STATUS_ORDER = ['new', 'contacted', 'in_progress', 'converted', 'closed_lost']
-            STATUS_LABELS = {
-                'new': 'New',
-                'contacted': 'Contacted',
-                'in_progress': 'In Progress',
-                'converted': 'Converted',
-                'closed_lost': 'Closed Lost',
+            # Single conditional-aggregation pass over the agent's daily rollup
+            STATUS_LABELS = dict(Lead.STATUS_CHOICES)
+            counts = {
+                key: value or 0
+                for key, value in stats.aggregate(
+                    total_leads=Sum('count'),
+                    **{
+                        f'{s}_leads': Sum('count', filter=Q(status=s))
+                        for s in STATUS_LABELS
+                    }
+                ).items()
             }
             
-            real_counts = (
-                queryset
-                .values('status')
-                .annotate(count=Count('id'))
-                .order_by('status')
-            )
+            total_leads     = counts['total_leads']
+            converted_leads = counts['converted_leads']
             
-            count_dict = {item['status']: item['count'] for item in real_counts}
+            conversion_rate = (converted_leads / total_leads * 100) if total_leads > 0 else 0
             
             status_breakdown = [
                 {
                     'status': s,
-                    'label': STATUS_LABELS[s],
-                    'count': count_dict.get(s, 0)
+                    'label': label,
+                    'count': counts[f'{s}_leads']
                 }
-                for s in STATUS_ORDER
+                for s, label in STATUS_LABELS.items()
             ]
             
             recent_date = now() - timedelta(days=7)
@@ -641,17 +1053,17 @@ class AgentAnalyticsViewSet(viewsets.ViewSet):
                 queryset
                 .filter(updated_at__gte=recent_date)   
                 .order_by('-updated_at')
-                .values('id', 'name', 'email', 'status', 'updated_at', 'internal_notes')[:5]
+                .values('id', 'name', 'email', 'status', 'updated_at')[:5]
             )
             
             data = {
                 'overview': {
                     'total_leads': total_leads,
-                    'new_leads': new_leads,
-                    'contacted_leads': contacted_leads,
-                    'in_progress_leads': in_progress_leads,
+                    'new_leads': counts['new_leads'],
+                    'contacted_leads': counts['contacted_leads'],
+                    'in_progress_leads': counts['in_progress_leads'],
                     'converted_leads': converted_leads,
-                    'closed_lost_leads': closed_lost_leads,
+                    'closed_lost_leads': counts['closed_lost_leads'],
                     'conversion_rate': round(conversion_rate, 2),
                 },
                 'status_breakdown': status_breakdown,
@@ -666,7 +1078,7 @@ class AgentAnalyticsViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-class HeroViewSet(viewsets.ModelViewSet):
+class HeroViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Hero model (admin only)
     """
@@ -705,7 +1117,7 @@ class PublicHeroViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return only active hero if CMS hero section is enabled"""
-        cms_settings = CMSSettings.get_settings()
+        cms_settings = CMSSettings.get_cached_settings()
         if not cms_settings.heroSection:
             return Hero.objects.none()
         
@@ -723,7 +1135,90 @@ class PublicHeroViewSet(viewsets.ReadOnlyModelViewSet):
         return Response({'detail': 'No active hero found'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class DealViewSet(viewsets.ModelViewSet):
+class PublicHomeView(APIView):
+    """
+    Public homepage bootstrap: every section enabled in CMS settings in one
+    response, cached per process until any of the underlying models change
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    
+    # (key, CMS settings flag, queryset factory, serializer)
+    LIST_SECTIONS = [
+        ('agents', 'agentsSection',
+         lambda: CustomUser.objects.filter(role='agent', status='active', profile_visible=True),
+         AgentSerializer),
+        ('properties', 'propertiesSection', Property.objects.all, PropertySerializer),
+        ('slides', 'propertiesSection', Slide.objects.all, SlideSerializer),
+        ('yourperfect', 'propertiesSection', YourPerfect.objects.all, YourPerfectSerializer),
+        ('collaborations', 'marketingSection', Collaboration.objects.all, CollaborationSerializer),
+        ('sidebarcard', 'marketingSection', SidebarCard.objects.all, SidebarCardSerializer),
+        ('damac', 'marketingSection', Damac.objects.all, DamacSerializer),
+        ('empoweringcommunities', 'marketingSection', EmpoweringCommunities.objects.all,
+         EmpoweringCommunitiesSerializer),
+    ]
+    
+    @classmethod
+    def build_payload(cls):
+        """Serialize the enabled sections and compute their ETag"""
+        cms_settings = CMSSettings.get_cached_settings()
+        data = {'settings': CMSSettingsSerializer(cms_settings).data}
+        
+        if cms_settings.heroSection:
+            hero = Hero.objects.filter(is_active=True).order_by('-updated_at').first()
+            data['hero'] = PublicHeroSerializer(hero).data if hero else None
+        
+        for key, flag, queryset, serializer_class in cls.LIST_SECTIONS:
+            if getattr(cms_settings, flag):
+                data[key] = serializer_class(queryset(), many=True).data
+        
+        body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+        etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+        return data, etag
+    
+    def get(self, request):
+        """Return the cached homepage payload, or 304 if the client has it"""
+        data, etag = _public_home_cache.get()
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            # A 304 carries the ETag the 200 would have
+            not_modified['ETag'] = etag
+            return not_modified
+        return Response(data, headers={'ETag': etag})
+
+
+_public_home_cache = VersionedLocalCache(
+    'public_home',
+    PublicHomeView.build_payload,
+    ttl=settings.PUBLIC_HOME_CACHE_TTL,
+    check_interval=settings.PUBLIC_HOME_VERSION_CHECK_INTERVAL,
+)
+
+
+# Columns of /api/deals/export/, besides the running totals
+DEAL_LEDGER_FIELDS = [
+    'id', 'closed_date', 'lead', 'lead_name', 'lead_email', 'agent_name', 'agent_email',
+    'currency', 'revenue_amount', 'commission_rate', 'commission_amount',
+]
+
+
+def with_running_totals(rows):
+    """
+    Add running_revenue and running_commission, the totals of the currency
+    of each row so far, to ledger rows taken in closing order
+    """
+    totals = {}
+    for row in rows:
+        revenue, commission = totals.get(row['currency'], (Decimal('0.00'), Decimal('0.00')))
+        revenue += row['revenue_amount']
+        commission += row['commission_amount'] or 0
+        totals[row['currency']] = (revenue, commission)
+        row['running_revenue'] = revenue
+        row['running_commission'] = commission
+        yield row
+
+
+class DealViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for Deal model (admin only)
     """
@@ -772,6 +1267,29 @@ class DealViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream the deals ledger, oldest first, as CSV (?format=csv, the
+        default) or NDJSON (?format=ndjson), with the same agent_id and
+        date filters as the list and per-currency running totals
+        """
+        rows = (
+            self.get_queryset()
+            .order_by('closed_date', 'id')
+            .values(
+                'id', 'closed_date', 'lead', 'currency',
+                'revenue_amount', 'commission_rate', 'commission_amount',
+                lead_name=F('lead__name'),
+                lead_email=F('lead__email'),
+                agent_name=user_display_name('lead__assigned_agent'),
+                agent_email=F('lead__assigned_agent__email'),
+            )
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        )
+        fields = DEAL_LEDGER_FIELDS + ['running_revenue', 'running_commission']
+        return streaming_export(request, with_running_totals(rows), fields, 'deals')
 
 
 class AgentRevenueView(APIView):
@@ -785,52 +1303,62 @@ class AgentRevenueView(APIView):
         try:
             agent = request.user
             
+            # Number of calendar months in the revenue series (default 12)
+            try:
+                months = int(request.query_params.get('months', 12))
+            except ValueError:
+                months = 12
+            months = max(1, min(months, 120))
+            
             # Get all deals for this agent's converted leads
-            agent_deals = Deal.objects.filter(
-                lead__assigned_agent=agent
-            ).select_related('lead').order_by('-closed_date')
-            
-            # Calculate totals
-            total_revenue = sum(deal.revenue_amount for deal in agent_deals)
-            total_commission = sum(deal.commission_amount or 0 for deal in agent_deals)
-            converted_leads_count = agent_deals.count()
-            
-            # Calculate revenue by month (last 12 months)
-            from django.db.models import Sum
-            from django.utils import timezone
-            from datetime import datetime
+            agent_deals = Deal.objects.filter(lead__assigned_agent=agent)
             
-            revenue_by_month = []
-            current_date = timezone.now()
+            # Calculate totals in the database
+            totals = agent_deals.aggregate(
+                total_revenue=Sum('revenue_amount'),
+                total_commission=Sum('commission_amount'),
+                converted_leads_count=Count('id'),
+            )
             
-            for i in range(12):
-                month_start = current_date.replace(day=1) - timezone.timedelta(days=30*i)
-                month_end = (month_start + timezone.timedelta(days=32)).replace(day=1) - timezone.timedelta(days=1)
-                
-                month_revenue = agent_deals.filter(
-                    closed_date__gte=month_start,
-                    closed_date__lte=month_end
-                ).aggregate(
+            # Calculate revenue by calendar month in a single grouped query
+            current_month = timezone.localdate().replace(day=1)
+            month_starts = [current_month]
+            for _ in range(months - 1):
+                month_starts.append((month_starts[-1] - timedelta(days=1)).replace(day=1))
+            month_starts.reverse()  # Oldest first
+            
+            monthly_totals = {
+                row['month']: row
+                for row in agent_deals
+                .filter(closed_date__gte=month_starts[0])
+                .annotate(month=TruncMonth('closed_date'))
+                .values('month')
+                .annotate(
                     total=Sum('revenue_amount'),
                     commission=Sum('commission_amount'),
-                    count=Count('id')
+                    count=Count('id'),
                 )
-                
+                .order_by('month')
+            }
+            
+            revenue_by_month = []
+            for month_start in month_starts:
+                month_revenue = monthly_totals.get(month_start, {})
                 revenue_by_month.append({
                     'month': month_start.strftime('%Y-%m'),
-                    'revenue': month_revenue['total'] or 0,
-                    'commission': month_revenue['commission'] or 0,
-                    'deals_count': month_revenue['count'] or 0
+                    'revenue': month_revenue.get('total') or 0,
+                    'commission': month_revenue.get('commission') or 0,
+                    'deals_count': month_revenue.get('count') or 0
                 })
             
             # Get recent deals (last 10)
-            recent_deals = agent_deals[:10]
+            recent_deals = agent_deals.select_related('lead').order_by('-closed_date')[:10]
             
             data = {
-                'total_revenue': total_revenue,
-                'total_commission': total_commission,
-                'converted_leads_count': converted_leads_count,
-                'revenue_by_month': list(reversed(revenue_by_month)),  # Most recent first
+                'total_revenue': totals['total_revenue'] or 0,
+                'total_commission': totals['total_commission'] or 0,
+                'converted_leads_count': totals['converted_leads_count'],
+                'revenue_by_month': revenue_by_month,
                 'recent_deals': recent_deals
             }
             